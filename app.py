@@ -1,4 +1,5 @@
 
+import click
 from flask import Flask, render_template, request, jsonify
 from flask_login import LoginManager
 from prometheus_flask_exporter import PrometheusMetrics
@@ -37,13 +38,17 @@ metrics = PrometheusMetrics(app)
 metrics.info('app_info', 'Book Logger Application', version='1.0.0')
 
 # Initialize db and models
-from models import db, User, VocabEntry
+from models import db, User, VocabEntry, ensure_schema
 from sqlalchemy import text
 db.init_app(app)
 
+from services import library_search, tags  # noqa: F401  (register the search/tag index DDL and sync hooks)
+
 with app.app_context():
     from models import Book
-    # Create all tables - SQLAlchemy handles this for both SQLite and PostgreSQL
+    # Migrate existing tables first: create_all then creates the missing tables,
+    # and the tag/search tables it creates are populated from the migrated rows
+    ensure_schema()
     db.create_all()
     # Note: For production migrations, consider using Alembic
 
@@ -52,10 +57,12 @@ from routes.books import bp as books_bp
 from routes.auth import bp as auth_bp
 from routes.vocab import bp as vocab_bp
 from routes.import_books import bp as import_bp
+from routes.sync import bp as sync_bp
 app.register_blueprint(books_bp)
 app.register_blueprint(auth_bp)
 app.register_blueprint(vocab_bp)
 app.register_blueprint(import_bp)
+app.register_blueprint(sync_bp)
 
 # Auth setup
 login_manager = LoginManager()
@@ -66,6 +73,15 @@ login_manager.init_app(app)
 def load_user(user_id):
     return User.query.get(int(user_id))
 
+@app.cli.command("reschedule")
+@click.option("--user-id", type=int, help="Only this user's cards (default: every deck).")
+def reschedule_command(user_id):
+    """Recompute due dates after changing SRS_ALGORITHM or scheduler parameters."""
+    from services import scheduling
+    with db.engine.begin() as connection:
+        count = scheduling.reschedule(connection, user_id)
+    click.echo(f"Rescheduled {count} cards")
+
 @app.route("/health")
 def health():
     """Health check endpoint for monitoring"""
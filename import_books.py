@@ -1,23 +1,77 @@
 import argparse
 import csv
+import gzip
+import hashlib
+import io
+import itertools
 import json
 import os
-from typing import Dict, Iterable, List, Optional, Tuple
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import IO, Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import bindparam, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 from app import app  # use configured Flask app
-from models import db, Book
-from services.isbn import fetch_isbn_metadata
+from models import db, book_key, Book
+from routes.import_books import LOOKUP_CHUNK_SIZE
+from services import library_search, tags, versions
+from services.cache import SQLiteCache
+from services.isbn import fetch_isbn_metadata, fetch_isbn_metadata_batch, to_isbn13
+
+JSON_READ_SIZE = 64 * 1024
+# ISBNs resolved per Open Library bibkeys request during enrichment
+ISBN_BATCH_SIZE = 50
+BOOK_COLUMNS = ("title", "author", "dedupe_key", "start_date", "finish_date", "rating", "tags", "notes")
+# Columns --update-existing overwrites (same as the ORM path)
+UPDATE_COLUMNS = ("start_date", "finish_date", "rating", "tags", "notes")
+# Where checkpoints go when the input's own directory is not writable
+CHECKPOINT_DIR = os.environ.get("IMPORT_CHECKPOINT_DIR") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "instance", "import-checkpoints"
+)
 
 
 def infer_format_from_path(path: str) -> str:
-    ext = os.path.splitext(path)[1].lower()
+    root, ext = os.path.splitext(path)
+    if ext.lower() == ".gz":
+        ext = os.path.splitext(root)[1]
+    ext = ext.lower()
     if ext in {".csv"}:
         return "csv"
     if ext in {".json"}:
         return "json"
+    if ext in {".ndjson", ".jsonl"}:
+        return "ndjson"
     raise ValueError(f"Cannot infer format from extension '{ext}'. Use --format.")
 
 
+def is_compressed(path: str) -> bool:
+    return path.lower().endswith(".gz")
+
+
+def open_input(path: str) -> IO[str]:
+    """Open a text input file, transparently decompressing ``.gz`` files."""
+    if is_compressed(path):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, encoding="utf-8", newline="")
+
+
+def open_binary(path: str) -> IO[bytes]:
+    if is_compressed(path):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def tracked_lines(f: IO[bytes], pos: List[int]) -> Iterator[str]:
+    """Decode lines from ``f``, keeping ``pos[0]`` at the byte offset after the last line read."""
+    for raw in f:
+        pos[0] += len(raw)
+        yield raw.decode("utf-8")
+
+
 def normalize_record(rec: Dict[str, str]) -> Dict[str, Optional[str]]:
     # Accept various key casings; default to empty string if missing
     def g(*keys: str) -> Optional[str]:
@@ -32,6 +86,7 @@ def normalize_record(rec: Dict[str, str]) -> Dict[str, Optional[str]]:
     except ValueError:
         rating = None
 
+    isbn = g("isbn", "ISBN", "Isbn")
     return {
         "title": g("title", "Title") or "",
         "author": g("author", "Author") or "",
@@ -40,19 +95,36 @@ def normalize_record(rec: Dict[str, str]) -> Dict[str, Optional[str]]:
         "rating": rating,
         "tags": g("tags", "Tags") or "",
         "notes": g("notes", "Notes") or "",
-        "isbn": g("isbn", "ISBN", "Isbn"),
+        # Canonical ISBN-13 so equivalent spellings share one lookup and cache entry
+        "isbn": to_isbn13(isbn) or isbn,
     }
 
 
-def read_csv(path: str) -> Iterable[Dict[str, Optional[str]]]:
-    with open(path, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            yield normalize_record(row)
+def read_csv(path: str, start_offset: int = 0) -> Iterable[Dict[str, Optional[str]]]:
+    """
+    Yield records, each tagged with ``_offset``: the input byte offset just
+    past it, where a resumed import can seek to. Compressed input cannot be
+    seeked into cheaply, so its records carry no offset.
+    """
+    seekable = not is_compressed(path)
+    with open_binary(path) as f:
+        pos = [0]
+        lines = tracked_lines(f, pos)
+        header = next(csv.reader(lines), None)
+        if header is None:
+            return
+        if seekable and start_offset > pos[0]:
+            f.seek(start_offset)
+            pos[0] = start_offset
+        for row in csv.DictReader(lines, fieldnames=header):
+            rec = normalize_record(row)
+            if seekable:
+                rec["_offset"] = pos[0]
+            yield rec
 
 
 def read_json(path: str) -> Iterable[Dict[str, Optional[str]]]:
-    with open(path, encoding="utf-8") as f:
+    with open_input(path) as f:
         data = json.load(f)
     if isinstance(data, dict):
         # support {"books": [...]} shape
@@ -68,89 +140,614 @@ def read_json(path: str) -> Iterable[Dict[str, Optional[str]]]:
         yield normalize_record(item)
 
 
+def read_ndjson(path: str, start_offset: int = 0) -> Iterable[Dict[str, Optional[str]]]:
+    """Like :func:`read_csv`: records carry ``_offset`` unless the input is compressed."""
+    seekable = not is_compressed(path)
+    with open_binary(path) as f:
+        pos = [start_offset if seekable else 0]
+        if pos[0]:
+            f.seek(pos[0])
+        for line in tracked_lines(f, pos):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, dict):
+                rec = normalize_record(item)
+                if seekable:
+                    rec["_offset"] = pos[0]
+                yield rec
+
+
+class _JSONStream:
+    """Incremental reader over a JSON text file, holding only a small buffer."""
+
+    def __init__(self, f: IO[str]) -> None:
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        data = self.f.read(JSON_READ_SIZE)
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character ('' at end of input)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, chars: str) -> str:
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError(f"Invalid JSON: expected one of {chars!r}, found {c!r}.")
+        self.pos += 1
+        return c
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A bare number at the end of the buffer may continue in the next read
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def array_items(self) -> Iterator[Any]:
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(",]") == "]":
+                return
+
+
+def iter_json_books(path: str) -> Iterable[Dict[str, Optional[str]]]:
+    """
+    Stream book objects out of a JSON list (or ``{"books": [...]}``) without
+    loading the whole document.
+    """
+    with open_input(path) as f:
+        stream = _JSONStream(f)
+        if stream.peek() == "{":
+            stream.expect("{")
+            while True:
+                if stream.peek() == "}":
+                    raise ValueError("JSON must be a list of book objects or contain a 'books' list.")
+                key = stream.value()
+                stream.expect(":")
+                if key == "books" and stream.peek() == "[":
+                    break
+                stream.value()
+                stream.expect(",}")
+        elif stream.peek() != "[":
+            raise ValueError("JSON must be a list of book objects.")
+        for item in stream.array_items():
+            if isinstance(item, dict):
+                yield normalize_record(item)
+
+
+def iter_chunks(records: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    chunk: List[Any] = []
+    for rec in records:
+        chunk.append(rec)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def lookup_chunk_keys(keys: Iterable[str], load_books: bool) -> Dict[str, Optional[Book]]:
+    """
+    Find which ``book_key`` values already exist, querying only the keys of
+    the current chunk. Values are the matching Book when ``load_books`` is
+    set, otherwise None.
+    """
+    keys = sorted(set(keys))
+    found: Dict[str, Optional[Book]] = {}
+    for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+        match = Book.dedupe_key.in_(keys[start:start + LOOKUP_CHUNK_SIZE])
+        if load_books:
+            found.update((b.dedupe_key, b) for b in Book.query.filter(match))
+        else:
+            found.update((k, None) for (k,) in db.session.query(Book.dedupe_key).filter(match))
+    return found
+
+
+def lookup_chunk_ids(keys: Iterable[str]) -> Dict[str, Optional[int]]:
+    """Like ``lookup_chunk_keys`` but returns the matching book ids, without ORM objects."""
+    keys = sorted(set(keys))
+    found: Dict[str, Optional[int]] = {}
+    for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+        match = Book.dedupe_key.in_(keys[start:start + LOOKUP_CHUNK_SIZE])
+        found.update((k, book_id) for book_id, k in db.session.query(Book.id, Book.dedupe_key).filter(match))
+    return found
+
+
 def load_existing_keyset() -> set:
-    # de-dupe by (lower(title), lower(author))
-    rows = db.session.query(Book.title, Book.author).all()
-    return {(t.lower(), a.lower()) for (t, a) in rows}
+    rows = db.session.query(Book.dedupe_key).filter(Book.dedupe_key.isnot(None))
+    return {k for (k,) in rows}
+
+
+def upsert_lookup_map() -> Dict[str, Book]:
+    rows = Book.query.filter(Book.dedupe_key.isnot(None))
+    return {b.dedupe_key: b for b in rows}
+
+
+def resolve_title_author(rec: Dict[str, Optional[str]], enrich_by_isbn: bool) -> Tuple[str, str]:
+    title = rec["title"] or ""
+    author = rec["author"] or ""
+    if enrich_by_isbn and (not title or not author) and rec.get("isbn"):
+        meta = fetch_isbn_metadata(rec["isbn"]) or {}
+        if not title:
+            title = (meta.get("title") or title or "").strip()
+        if not author:
+            author = (meta.get("author") or author or "").strip()
+    return title, author
+
+
+class _IsbnChunk:
+    """ISBNs resolved together by one worker; ``future`` is set once submitted."""
+
+    def __init__(self) -> None:
+        self.isbns: List[str] = []
+        self.future: Optional[Future] = None
+
+
+def lookup_isbn_chunk(isbns: List[str]) -> Dict[str, Optional[Dict[str, str]]]:
+    """One bibkeys request for the chunk, then per-ISBN lookups for the ISBNs it missed."""
+    found = fetch_isbn_metadata_batch(isbns, chunk_size=len(isbns))
+    return {
+        isbn: found.get(isbn.replace("-", "").strip()) or fetch_isbn_metadata(isbn)
+        for isbn in isbns
+    }
+
+
+def enrich_records(
+    records: Iterable[Dict[str, Optional[str]]],
+    concurrency: int = 8,
+    cache: Optional[SQLiteCache] = None,
+) -> Iterator[Dict[str, Optional[str]]]:
+    """
+    Fill missing title/author from Open Library by ISBN as a pipeline stage.
+
+    ISBNs are resolved ``ISBN_BATCH_SIZE`` at a time on ``concurrency``
+    threads, up to ``concurrency * ISBN_BATCH_SIZE`` records ahead of the
+    consumer (the DB writer); records are yielded in input order. Resolved
+    ISBNs are kept in ``cache`` so re-runs skip them.
+    """
+    window: Deque[Tuple[Dict[str, Optional[str]], Optional[_IsbnChunk]]] = deque()
+    in_flight: Dict[str, _IsbnChunk] = {}
+    max_ahead = max(1, concurrency) * ISBN_BATCH_SIZE
+    filling = _IsbnChunk()
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="enrich") as pool:
+
+        def submit(chunk: _IsbnChunk) -> None:
+            chunk.future = pool.submit(lookup_isbn_chunk, chunk.isbns)
+
+        def finish(rec: Dict[str, Optional[str]], chunk: Optional[_IsbnChunk]) -> Dict[str, Optional[str]]:
+            if chunk is None:
+                return rec
+            if chunk.future is None:
+                # The writer caught up with a chunk that is still filling
+                submit(chunk)
+            isbn = rec["isbn"]
+            meta = chunk.future.result().get(isbn) or {}
+            if in_flight.pop(isbn, None) is not None and meta and cache is not None:
+                cache.set(isbn, meta)
+            return apply_metadata(rec, meta)
+
+        for rec in records:
+            chunk = None
+            isbn = rec.get("isbn")
+            if isbn and (not rec["title"] or not rec["author"]):
+                cached, _ = cache.get(isbn) if cache is not None else (None, None)
+                if cached is not None:
+                    rec = apply_metadata(rec, cached)
+                else:
+                    chunk = in_flight.get(isbn)
+                    if chunk is None:
+                        if filling.future is not None:
+                            filling = _IsbnChunk()
+                        chunk = in_flight[isbn] = filling
+                        filling.isbns.append(isbn)
+                        if len(filling.isbns) >= ISBN_BATCH_SIZE:
+                            submit(filling)
+            window.append((rec, chunk))
+            while len(window) > max_ahead:
+                yield finish(*window.popleft())
+        while window:
+            yield finish(*window.popleft())
+
+
+def apply_metadata(rec: Dict[str, Optional[str]], meta: Dict[str, str]) -> Dict[str, Optional[str]]:
+    rec = dict(rec)
+    if not rec["title"]:
+        rec["title"] = (meta.get("title") or "").strip()
+    if not rec["author"]:
+        rec["author"] = (meta.get("author") or "").strip()
+    return rec
+
+
+def read_records(
+    source_path: str, fmt: str, stream: bool, start_offset: int = 0
+) -> Iterable[Dict[str, Optional[str]]]:
+    if fmt == "auto":
+        fmt = infer_format_from_path(source_path)
+
+    if fmt == "csv":
+        return read_csv(source_path, start_offset)
+    if fmt == "json":
+        return iter_json_books(source_path) if stream else read_json(source_path)
+    if fmt == "ndjson":
+        return read_ndjson(source_path, start_offset)
+    raise ValueError("Unsupported format. Use 'csv', 'json' or 'ndjson'.")
+
+
+def default_checkpoint_path(source_path: str) -> str:
+    """
+    ``<input>.checkpoint.json`` next to the input, or a file named after the
+    input's absolute path in ``CHECKPOINT_DIR`` when that directory is read-only.
+    """
+    if os.access(os.path.dirname(os.path.abspath(source_path)), os.W_OK):
+        return f"{source_path}.checkpoint.json"
+    source = os.path.abspath(source_path)
+    digest = hashlib.sha1(source.encode("utf-8")).hexdigest()[:12]
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    return os.path.join(CHECKPOINT_DIR, f"{os.path.basename(source)}-{digest}.checkpoint.json")
+
+
+class Checkpoint:
+    """
+    Import progress, rewritten atomically after every commit: records
+    consumed, the input byte offset after the last committed record
+    (uncompressed CSV and NDJSON), batches committed and running totals.
+    ``--resume`` restarts from it.
+    """
+
+    TOTALS = ("rows", "batches", "created", "updated", "skipped")
+
+    def __init__(self, path: str, source_path: str) -> None:
+        self.path = path
+        st = os.stat(source_path)
+        self.source = {"source": os.path.abspath(source_path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        self.base = dict.fromkeys(self.TOTALS, 0)
+        self.batches = 0
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, encoding="utf-8") as f:
+            state = json.load(f)
+        if any(state.get(k) != v for k, v in self.source.items()):
+            raise ValueError(f"Input changed since checkpoint {self.path} was written; delete it to start over.")
+        self.base = {k: state.get(k, 0) for k in self.TOTALS}
+        return state
+
+    def save(
+        self, rows: int, last: Optional[Dict[str, Optional[str]]], created: int, updated: int, skipped: int
+    ) -> None:
+        self.batches += 1
+        current = {"rows": rows, "batches": self.batches, "created": created, "updated": updated, "skipped": skipped}
+        state = {
+            **self.source,
+            **{k: self.base[k] + current[k] for k in self.TOTALS},
+            "offset": (last or {}).get("_offset"),
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def apply_record(b: Book, rec: Dict[str, Optional[str]]) -> None:
+    b.start_date = rec["start_date"]
+    b.finish_date = rec["finish_date"]
+    b.rating = rec["rating"]
+    b.tags = rec["tags"] or ""
+    b.notes = rec["notes"] or ""
+
+
+def new_book(title: str, author: str, rec: Dict[str, Optional[str]]) -> Book:
+    return Book(
+        title=title,
+        author=author,
+        start_date=rec["start_date"],
+        finish_date=rec["finish_date"],
+        rating=rec["rating"],
+        tags=rec["tags"] or "",
+        notes=rec["notes"] or "",
+    )
+
+
+def import_books_streaming(
+    records: Iterable[Dict[str, Optional[str]]],
+    batch_size: int,
+    update_existing: bool,
+    enrich_by_isbn: bool,
+    checkpoint: Optional[Checkpoint] = None,
+) -> Tuple[int, int, int]:
+    """
+    Import ``batch_size`` records at a time, looking up only that batch's keys
+    in the database and committing once per batch, so memory stays flat
+    regardless of input or table size.
+    """
+    created = 0
+    updated = 0
+    skipped = 0
+    consumed = 0
+
+    for chunk in iter_chunks(records, batch_size):
+        rows = []
+        for rec in chunk:
+            title, author = resolve_title_author(rec, enrich_by_isbn)
+            if not title or not author:
+                skipped += 1
+                continue
+            rows.append((title, author, rec))
+
+        # Books are unique by book_key, so existing rows are always looked up
+        existing = lookup_chunk_keys((book_key(t, a) for t, a, _ in rows), load_books=update_existing)
+
+        buffer: List[Book] = []
+        for title, author, rec in rows:
+            key = book_key(title, author)
+            if update_existing and key in existing:
+                apply_record(existing[key], rec)
+                updated += 1
+                continue
+            if key in existing:
+                skipped += 1
+                continue
+            b = new_book(title, author, rec)
+            buffer.append(b)
+            # Later rows with the same key in this batch match this one
+            existing[key] = b
+
+        db.session.add_all(buffer)
+        db.session.commit()
+        db.session.expunge_all()
+        created += len(buffer)
+        consumed += len(chunk)
+        if checkpoint is not None:
+            checkpoint.save(consumed, chunk[-1], created, updated, skipped)
+
+    return created, updated, skipped
+
+
+def book_row(title: str, author: str, rec: Dict[str, Optional[str]]) -> Dict[str, Any]:
+    return {
+        "title": title,
+        "author": author,
+        "dedupe_key": book_key(title, author),
+        "start_date": rec["start_date"],
+        "finish_date": rec["finish_date"],
+        "rating": rec["rating"],
+        "tags": rec["tags"] or "",
+        "notes": rec["notes"] or "",
+    }
+
 
+def insert_rows_sqlite(conn, rows: List[Dict[str, Any]]) -> int:
+    """executemany INSERT ... ON CONFLICT DO NOTHING; returns rows inserted."""
+    result = conn.execute(sqlite_insert(Book.__table__).on_conflict_do_nothing(), rows)
+    return max(result.rowcount, 0)
+
+
+def copy_rows_postgres(conn, rows: List[Dict[str, Any]]) -> int:
+    """
+    COPY the batch into a temporary staging table, then move it into ``book``
+    with INSERT ... ON CONFLICT DO NOTHING; returns rows inserted.
+    """
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        writer.writerow(["\\N" if row[c] is None else row[c] for c in BOOK_COLUMNS])
+    buf.seek(0)
+    columns = ", ".join(BOOK_COLUMNS)
+    cur = conn.connection.cursor()
+    try:
+        cur.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS book_import ON COMMIT DELETE ROWS "
+            f"AS SELECT {columns} FROM book WITH NO DATA"
+        )
+        cur.copy_expert(f"COPY book_import ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buf)
+        cur.execute(
+            f"INSERT INTO book ({columns}) SELECT {columns} FROM book_import ON CONFLICT DO NOTHING"
+        )
+        return max(cur.rowcount, 0)
+    finally:
+        cur.close()
+
+
+def import_books_fast(
+    records: Iterable[Dict[str, Optional[str]]],
+    batch_size: int,
+    update_existing: bool,
+    enrich_by_isbn: bool,
+    checkpoint: Optional[Checkpoint] = None,
+) -> Tuple[int, int, int]:
+    """
+    Bulk-load through SQLAlchemy Core, skipping per-row ORM objects: batched
+    executemany upserts on SQLite, ``COPY FROM STDIN`` on PostgreSQL. Existing
+    rows are looked up per batch as in the streaming mode.
+    """
+    conn = db.session.connection()
+    write_rows = copy_rows_postgres if conn.dialect.name == "postgresql" else insert_rows_sqlite
+    update_stmt = (
+        update(Book.__table__)
+        .where(Book.__table__.c.id == bindparam("b_id"))
+        .values({c: bindparam(c) for c in UPDATE_COLUMNS})
+    )
+    created = 0
+    updated = 0
+    skipped = 0
+    consumed = 0
+
+    for chunk in iter_chunks(records, batch_size):
+        rows = []
+        for rec in chunk:
+            title, author = resolve_title_author(rec, enrich_by_isbn)
+            if not title or not author:
+                skipped += 1
+                continue
+            rows.append(book_row(title, author, rec))
+
+        # Without a lookup, ON CONFLICT on the dedupe_key index skips existing books
+        existing: Dict[str, Optional[int]] = {}
+        if update_existing:
+            existing = lookup_chunk_ids(r["dedupe_key"] for r in rows)
+
+        inserts = []
+        updates = []
+        seen = set()
+        for row in rows:
+            key = row["dedupe_key"]
+            if key in seen:
+                skipped += 1  # repeated later in this batch
+                continue
+            seen.add(key)
+            if key in existing:
+                if update_existing and existing[key] is not None:
+                    updates.append({"b_id": existing[key], **{c: row[c] for c in UPDATE_COLUMNS}})
+                else:
+                    skipped += 1
+                continue
+            inserts.append(row)
+
+        conn = db.session.connection()
+        if inserts:
+            inserted = write_rows(conn, inserts)
+            created += inserted
+            skipped += len(inserts) - inserted
+        if updates:
+            conn.execute(update_stmt, updates)
+            updated += len(updates)
+            # Bulk UPDATEs skip the ORM flush hooks that keep library search, tags and versions in sync
+            updated_ids = [u["b_id"] for u in updates]
+            library_search.refresh_books(conn, updated_ids)
+            tags.refresh_books(conn, updated_ids)
+            versions.bump_for_books(conn, updated_ids)
+        db.session.commit()
+        consumed += len(chunk)
+        if checkpoint is not None:
+            checkpoint.save(consumed, chunk[-1], created, updated, skipped)
 
-def upsert_lookup_map() -> Dict[Tuple[str, str], Book]:
-    rows = Book.query.all()
-    return {(b.title.lower(), b.author.lower()): b for b in rows}
+    return created, updated, skipped
 
 
 def import_books(
     source_path: str,
     fmt: str,
     batch_size: int,
-    dedupe: bool,
     update_existing: bool,
     enrich_by_isbn: bool,
+    stream: bool = False,
+    fast: bool = False,
+    enrich_concurrency: int = 8,
+    isbn_cache_path: Optional[str] = None,
+    checkpoint_path: Optional[str] = None,
+    resume: bool = False,
 ) -> Tuple[int, int, int]:
-    if fmt == "auto":
-        fmt = infer_format_from_path(source_path)
-
-    if fmt == "csv":
-        records = read_csv(source_path)
-    elif fmt == "json":
-        records = read_json(source_path)
+    checkpoint = Checkpoint(checkpoint_path, source_path) if checkpoint_path else None
+    state = checkpoint.load() if checkpoint is not None and resume else None
+    start_offset = (state or {}).get("offset")
+    records = read_records(source_path, fmt, stream or fast, start_offset or 0)
+    if state and start_offset is None:
+        # JSON and compressed input have no byte offsets: skip forward by record
+        # count, which still reads (and decompresses) the skipped part
+        records = itertools.islice(records, state["rows"], None)
+    if enrich_by_isbn:
+        cache = SQLiteCache("isbn_metadata", path=isbn_cache_path)
+        records = enrich_records(records, enrich_concurrency, cache)
+        enrich_by_isbn = False  # already done by the pipeline stage
+    if fast:
+        result = import_books_fast(records, batch_size, update_existing, enrich_by_isbn, checkpoint)
+    elif stream:
+        result = import_books_streaming(records, batch_size, update_existing, enrich_by_isbn, checkpoint)
     else:
-        raise ValueError("Unsupported format. Use 'csv' or 'json'.")
+        result = import_books_orm(records, batch_size, update_existing, enrich_by_isbn, checkpoint)
+    if checkpoint is not None:
+        checkpoint.clear()
+    return result
+
 
+def import_books_orm(
+    records: Iterable[Dict[str, Optional[str]]],
+    batch_size: int,
+    update_existing: bool,
+    enrich_by_isbn: bool,
+    checkpoint: Optional[Checkpoint] = None,
+) -> Tuple[int, int, int]:
     created = 0
     updated = 0
     skipped = 0
+    consumed = 0
+    rec = None
 
-    existing_keys = load_existing_keyset() if dedupe else set()
+    existing_keys = load_existing_keyset()
     lookup = upsert_lookup_map() if update_existing else {}
 
     buffer: List[Book] = []
 
     for rec in records:
-        title = rec["title"] or ""
-        author = rec["author"] or ""
-        if enrich_by_isbn and (not title or not author) and rec.get("isbn"):
-            meta = fetch_isbn_metadata(rec["isbn"]) or {}
-            if not title:
-                title = (meta.get("title") or title or "").strip()
-            if not author:
-                author = (meta.get("author") or author or "").strip()
+        consumed += 1
+        title, author = resolve_title_author(rec, enrich_by_isbn)
         if not title or not author:
             skipped += 1
             continue
 
-        key = (title.lower(), author.lower())
+        key = book_key(title, author)
 
         if update_existing and key in lookup:
-            b = lookup[key]
-            b.start_date = rec["start_date"]
-            b.finish_date = rec["finish_date"]
-            b.rating = rec["rating"]
-            b.tags = rec["tags"] or ""
-            b.notes = rec["notes"] or ""
+            apply_record(lookup[key], rec)
             updated += 1
             continue
 
-        if dedupe and key in existing_keys:
+        if key in existing_keys:
             skipped += 1
             continue
 
-        b = Book(
-            title=title,
-            author=author,
-            start_date=rec["start_date"],
-            finish_date=rec["finish_date"],
-            rating=rec["rating"],
-            tags=rec["tags"] or "",
-            notes=rec["notes"] or "",
-        )
+        b = new_book(title, author, rec)
         buffer.append(b)
+        existing_keys.add(key)
+        if update_existing:
+            lookup[key] = b
 
         if len(buffer) >= batch_size:
             db.session.add_all(buffer)
             db.session.commit()
             created += len(buffer)
             buffer.clear()
+            if checkpoint is not None:
+                checkpoint.save(consumed, rec, created, updated, skipped)
 
     if buffer:
         db.session.add_all(buffer)
@@ -164,14 +761,14 @@ def import_books(
 
 
 def main() -> None:
-    parser = argparse.ArgumentParser(description="Bulk import books into the SQLite database.")
+    parser = argparse.ArgumentParser(description="Bulk import books into the database.")
     parser.add_argument("input", help="Path to input file (CSV or JSON)")
     parser.add_argument(
         "--format",
         dest="fmt",
         default="auto",
-        choices=["auto", "csv", "json"],
-        help="Input format (default: auto from extension)",
+        choices=["auto", "csv", "json", "ndjson"],
+        help="Input format (default: auto from extension; .gz inputs are decompressed)",
     )
     parser.add_argument(
         "--batch-size",
@@ -182,7 +779,7 @@ def main() -> None:
     parser.add_argument(
         "--dedupe",
         action="store_true",
-        help="Skip rows that already exist (title+author match)",
+        help="Deprecated, no effect: existing books (same normalized title+author) are always skipped",
     )
     parser.add_argument(
         "--update-existing",
@@ -194,22 +791,65 @@ def main() -> None:
         action="store_true",
         help="When title/author missing and ISBN present, fetch metadata from Open Library",
     )
+    parser.add_argument(
+        "--enrich-concurrency",
+        type=int,
+        default=8,
+        help="Parallel Open Library lookups for --enrich-by-isbn (default: 8)",
+    )
+    parser.add_argument(
+        "--isbn-cache",
+        default=None,
+        help="SQLite file caching resolved ISBNs across runs (default: the shared app cache)",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        default=None,
+        help="Progress file written after every commit (default: <input>.checkpoint.json, "
+        "or $IMPORT_CHECKPOINT_DIR / instance/import-checkpoints if the input's directory is read-only)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue from the checkpoint of an interrupted run",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Read input incrementally and look up existing rows per batch, keeping memory flat",
+    )
+    parser.add_argument(
+        "--fast",
+        action="store_true",
+        help="Bulk-load via SQLAlchemy Core (executemany upserts on SQLite, COPY on PostgreSQL); implies --stream",
+    )
 
     args = parser.parse_args()
+    if args.dedupe:
+        print("warning: --dedupe is deprecated and has no effect; existing books are always skipped", file=sys.stderr)
 
     with app.app_context():
+        started = time.perf_counter()
         created, updated, skipped = import_books(
             source_path=args.input,
             fmt=args.fmt,
             batch_size=args.batch_size,
-            dedupe=args.dedupe,
             update_existing=args.update_existing,
             enrich_by_isbn=args.enrich_by_isbn,
+            stream=args.stream,
+            fast=args.fast,
+            enrich_concurrency=args.enrich_concurrency,
+            isbn_cache_path=args.isbn_cache,
+            checkpoint_path=args.checkpoint or default_checkpoint_path(args.input),
+            resume=args.resume,
         )
+        elapsed = time.perf_counter() - started
+        rows = created + updated + skipped
 
         print(
             f"Import complete. created={created}, updated={updated}, skipped={skipped}"
         )
+        print(f"{rows} rows in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.0f} rows/sec)")
 
 
 if __name__ == "__main__":
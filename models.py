@@ -1,15 +1,36 @@
+import unicodedata
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect, text
+from sqlalchemy.schema import CreateIndex
 from sqlalchemy.sql import func
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from services.isbn import to_isbn13
+
 db = SQLAlchemy()
 
 
+def book_key(title: str, author: str) -> str:
+    """Normalized title/author identity of a book: casefolded, punctuation
+    stripped and whitespace collapsed, so "The Hobbit" by "J.R.R. Tolkien" and
+    "the hobbit" by "JRR  Tolkien" are the same book."""
+    def norm(value):
+        value = unicodedata.normalize('NFKC', value or '').casefold()
+        value = ''.join(ch for ch in value if not unicodedata.category(ch).startswith('P'))
+        return ' '.join(value.split())
+    return f"{norm(title)}|{norm(author)}"
+
+
 class Book(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     author = db.Column(db.String(200), nullable=False)
-    isbn = db.Column(db.String(20), index=True)
+    # book_key(title, author); find-or-create goes through this unique index.
+    # NULL only for duplicates that predate the column (see ensure_schema).
+    dedupe_key = db.Column(db.String(512), unique=True, index=True)
+    isbn = db.Column(db.String(20), index=True)  # as entered
+    isbn13 = db.Column(db.String(13), index=True)  # to_isbn13(isbn); ISBN lookups use this
     cover_id = db.Column(db.Integer, index=True)
     start_date = db.Column(db.String(20))
     finish_date = db.Column(db.String(20))
@@ -18,10 +39,24 @@ class Book(db.Model):
     notes = db.Column(db.Text)
 
 
+@event.listens_for(Book, 'before_insert')
+@event.listens_for(Book, 'before_update')
+def _set_derived_columns(mapper, connection, target):
+    state = inspect(target)
+    if not state.persistent or state.attrs.title.history.has_changes() or state.attrs.author.history.has_changes():
+        target.dedupe_key = book_key(target.title, target.author)
+    if not state.persistent or state.attrs.isbn.history.has_changes():
+        target.isbn13 = to_isbn13(target.isbn)
+
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(255), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(255), nullable=False)
+    # Bumped on every write to the user's library or vocabulary (services.versions)
+    library_version = db.Column(db.Integer, default=0)
+    # services.scheduling algorithm name; NULL means the app default (SRS_ALGORITHM)
+    srs_algorithm = db.Column(db.String(20))
 
     # Flask-Login helpers
     @property
@@ -47,6 +82,15 @@ class User(db.Model):
 
 
 class UserBook(db.Model):
+    __table_args__ = (
+        # Keyset pagination walks a user's library by descending id
+        db.Index('ix_user_book_user_id_id', 'user_id', 'id'),
+        # One link per user and book; add_to_library upserts against it
+        db.Index('ix_user_book_user_id_book_id', 'user_id', 'book_id', unique=True),
+        # Delta sync reads the rows changed since a library version
+        db.Index('ix_user_book_user_id_version', 'user_id', 'version'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False, index=True)
@@ -56,10 +100,32 @@ class UserBook(db.Model):
     finish_date = db.Column(db.String(20))
     tags = db.Column(db.String(200))
     notes = db.Column(db.Text)
+    # Client-side default too: on SQLite ensure_schema adds the column without its server default
+    updated_at = db.Column(db.DateTime, default=func.now(), server_default=func.now(), onupdate=func.now())
+    version = db.Column(db.Integer, default=0)  # owner's library_version at the last write
+
 
+class UserBookTag(db.Model):
+    """One tag of a library entry: the split, trimmed ``UserBook.tags`` (or the
+    book's tags when the entry has none), maintained by services.tags."""
+    __table_args__ = (
+        # Facet counts and tag-filtered keyset pages read only this index
+        db.Index('ix_user_book_tag_user_id_tag', 'user_id', 'tag', 'user_book_id'),
+    )
+
+    user_book_id = db.Column(db.Integer, db.ForeignKey('user_book.id', ondelete='CASCADE'), primary_key=True)
+    tag = db.Column(db.String(200), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
 
 class VocabEntry(db.Model):
+    __table_args__ = (
+        db.Index('ix_vocab_entry_user_id_version', 'user_id', 'version'),
+        # Due-queue pages are range scans over these, ordered by (next_review_at, id)
+        db.Index('ix_vocab_entry_user_id_next_review_at', 'user_id', 'next_review_at', 'id'),
+        db.Index('ix_vocab_entry_user_id_book_id_next_review_at', 'user_id', 'book_id', 'next_review_at', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False, index=True)
@@ -68,6 +134,203 @@ class VocabEntry(db.Model):
     quote = db.Column(db.Text)
     srs_box = db.Column(db.Integer, default=1, nullable=False, index=True)  # Leitner box 1..5
     next_review_at = db.Column(db.DateTime, index=True)
+    # Scheduler state (services.scheduling); NULL until an algorithm needs it
+    last_reviewed_at = db.Column(db.DateTime)
+    interval_days = db.Column(db.Float)
+    repetitions = db.Column(db.Integer)  # successful reviews in a row
+    lapses = db.Column(db.Integer)
+    ease = db.Column(db.Float)  # SM-2 ease factor
+    stability = db.Column(db.Float)  # FSRS memory stability, in days
+    difficulty = db.Column(db.Float)  # FSRS difficulty, 1..10
     created_at = db.Column(db.DateTime, server_default=func.now(), nullable=False)
     updated_at = db.Column(db.DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
+    version = db.Column(db.Integer, default=0)  # owner's library_version at the last write
+
+
+class Tombstone(db.Model):
+    """A deleted library entry or vocabulary entry, for delta sync."""
+    __table_args__ = (
+        db.Index('ix_tombstone_user_id_version', 'user_id', 'version'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # user_book, vocab_entry
+    row_id = db.Column(db.Integer, nullable=False)
+    book_id = db.Column(db.Integer)
+    version = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, server_default=func.now(), nullable=False)
+
+
+class ReviewLog(db.Model):
+    """One flashcard answer. Append-only: rows are never updated, and they
+    outlive the cards they log (for retention analytics and tuning)."""
+    __table_args__ = (
+        # Retention aggregates are range scans over these (reviewed_at and correct are covered)
+        db.Index('ix_review_log_user_id_reviewed_at', 'user_id', 'reviewed_at', 'correct'),
+        db.Index('ix_review_log_user_id_srs_box', 'user_id', 'srs_box', 'reviewed_at', 'correct'),
+        db.Index('ix_review_log_user_id_book_id', 'user_id', 'book_id', 'reviewed_at', 'correct'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    vocab_entry_id = db.Column(db.Integer, nullable=False)
+    book_id = db.Column(db.Integer, nullable=False)
+    srs_box = db.Column(db.Integer, nullable=False)  # box the card was in when answered
+    correct = db.Column(db.Boolean, nullable=False)
+    reviewed_at = db.Column(db.DateTime, nullable=False)
+    scheduled_days = db.Column(db.Float)  # interval the card had been given
+    elapsed_days = db.Column(db.Float)  # time since its previous review
+    algorithm = db.Column(db.String(20))
+
+
+class Job(db.Model):
+    """A background job (e.g. cover backfill) and its progress."""
+    __table_args__ = (
+        # At most one active cover backfill: a concurrent start fails its insert instead of queueing a second one
+        db.Index(
+            'ix_job_active_backfill_covers', 'kind', unique=True,
+            sqlite_where=db.text("kind = 'backfill_covers' AND status IN ('queued', 'running')"),
+            postgresql_where=db.text("kind = 'backfill_covers' AND status IN ('queued', 'running')"),
+        ),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, failed
+    total = db.Column(db.Integer)
+    processed = db.Column(db.Integer, default=0, nullable=False)
+    succeeded = db.Column(db.Integer, default=0, nullable=False)
+    skipped = db.Column(db.Integer, default=0, nullable=False)
+    failed = db.Column(db.Integer, default=0, nullable=False)
+    last_id = db.Column(db.Integer)  # resume point: last fully processed row id
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, server_default=func.now(), nullable=False)
+    updated_at = db.Column(db.DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
+    finished_at = db.Column(db.DateTime)
+
+
+class ImportJobRow(db.Model):
+    """An input row staged for a background import Job."""
+    __table_args__ = (
+        db.Index('ix_import_job_row_job_id_row_number', 'job_id', 'row_number'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('job.id'), nullable=False)
+    row_number = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.Text, nullable=False)  # JSON-encoded row
+    error = db.Column(db.Text)
+
+
+def _backfill_book_keys(conn, batch_size=1000) -> None:
+    """Fill ``book.dedupe_key`` for rows created before the column existed.
+
+    The lowest id of each key keeps it; later duplicates are left NULL so the
+    unique index can be built without rewriting anyone's library.
+    """
+    book = Book.__table__
+    taken = {k for (k,) in conn.execute(db.select(book.c.dedupe_key).where(book.c.dedupe_key.isnot(None)))}
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            db.select(book.c.id, book.c.title, book.c.author)
+            .where(book.c.dedupe_key.is_(None), book.c.id > last_id)
+            .order_by(book.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return
+        updates = []
+        for book_id, title, author in rows:
+            key = book_key(title, author)
+            if key not in taken:
+                taken.add(key)
+                updates.append({'b_id': book_id, 'key': key})
+        if updates:
+            conn.execute(
+                book.update().where(book.c.id == db.bindparam('b_id')).values(dedupe_key=db.bindparam('key')),
+                updates,
+            )
+        last_id = rows[-1][0]
+
+
+def _backfill_isbn13(conn, batch_size=1000) -> None:
+    """Fill ``book.isbn13`` for rows with an ISBN; invalid ISBNs stay NULL."""
+    book = Book.__table__
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            db.select(book.c.id, book.c.isbn)
+            .where(book.c.isbn13.is_(None), book.c.isbn.isnot(None), book.c.isbn != '', book.c.id > last_id)
+            .order_by(book.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return
+        updates = [{'b_id': book_id, 'isbn13': to_isbn13(isbn)} for book_id, isbn in rows]
+        updates = [u for u in updates if u['isbn13']]
+        if updates:
+            conn.execute(
+                book.update().where(book.c.id == db.bindparam('b_id')).values(isbn13=db.bindparam('isbn13')),
+                updates,
+            )
+        last_id = rows[-1][0]
+
+
+def _dedupe_user_books(conn) -> None:
+    """Drop repeated user/book links, keeping the oldest, so the unique index can be built."""
+    user_book = UserBook.__table__
+    keep = db.select(func.min(user_book.c.id)).group_by(user_book.c.user_id, user_book.c.book_id)
+    conn.execute(user_book.delete().where(user_book.c.id.not_in(keep)))
+
+
+def _backfill_default(conn, column) -> None:
+    """Give existing rows the default of a column that was just added."""
+    if column.server_default is not None:
+        value = column.server_default.arg
+        value = text(value) if isinstance(value, str) else value
+    elif column.default is not None and column.default.is_scalar:
+        value = column.default.arg
+    else:
+        return
+    conn.execute(column.table.update().values({column.name: value}))
+
+
+def ensure_schema() -> None:
+    """Lightweight migrations for databases created by an older version.
 
+    ``db.create_all`` only creates missing tables, so columns and indexes that
+    were added to existing tables are created here. Existing rows get the new
+    column's default (SQLite cannot add a column with a non-constant default,
+    so they are filled afterwards). Run it before
+    ``db.create_all``: the derived tables that creates (tags, search) are
+    filled from ``user_book`` and must not see links deduped here.
+    """
+    inspector = inspect(db.engine)
+    preparer = db.engine.dialect.identifier_preparer
+    with db.engine.begin() as conn:
+        tables = [t for t in db.metadata.sorted_tables if inspector.has_table(t.name)]
+        for table in tables:
+            columns = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in columns:
+                    continue
+                col_type = column.type.compile(dialect=db.engine.dialect)
+                conn.execute(text(
+                    f"ALTER TABLE {preparer.format_table(table)} "
+                    f"ADD COLUMN {preparer.format_column(column)} {col_type}"
+                ))
+                _backfill_default(conn, column)
+        if Book.__table__ in tables:
+            _backfill_book_keys(conn)
+            _backfill_isbn13(conn)
+        if UserBook.__table__ in tables:
+            indexes = {i['name'] for i in inspector.get_indexes(UserBook.__tablename__)}
+            if 'ix_user_book_user_id_book_id' not in indexes:
+                _dedupe_user_books(conn)
+        for table in tables:
+            for index in table.indexes:
+                # Let the database skip indexes that already exist
+                conn.execute(CreateIndex(index, if_not_exists=True))
@@ -1,12 +1,64 @@
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, Response
-import requests
-from models import db, Book, UserBook
+from flask import Blueprint, abort, current_app, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context
+import json
+import zlib
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, book_key, Book, Job, UserBook, UserBookTag
 from flask_login import login_required, current_user
-from services.isbn import search_books
+from services import jobs, library_search, versions
+from services import tags as library_tags
+from services.covers import BACKFILL_KIND, run_backfill, start_backfill
+from services.isbn import search_books, to_isbn13
 
 bp = Blueprint('books', __name__)
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+EXPORT_CHUNK_SIZE = 1000
+MAX_BATCH_IDS = 100
+EXPORT_FIELDS = ('id', 'title', 'author', 'isbn', 'cover_id', 'start_date', 'finish_date', 'rating', 'tags', 'notes')
+
+
+def _library_query(user_id):
+    """The user's (UserBook, Book) rows, newest first."""
+    return (
+        db.session.query(UserBook, Book)
+        .join(Book, UserBook.book_id == Book.id)
+        .filter(UserBook.user_id == user_id)
+        .order_by(UserBook.id.desc())
+    )
+
+
+def _page_args():
+    """Read ``limit``/``cursor`` query args.
+
+    Returns ``(None, None)`` when neither is given so callers can fall back to
+    the unpaginated listing.
+    """
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor', type=int)
+    if limit is None and cursor is None:
+        return None, None
+    limit = max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+    return limit, cursor
+
+
+def _library_page(user_id, limit, cursor, tag=None):
+    """Keyset page over ``(user_id, id)``, optionally only entries tagged
+    ``tag``; returns ``(rows, next_cursor)``."""
+    query = _library_query(user_id)
+    if tag is not None:
+        query = query.join(UserBookTag, UserBookTag.user_book_id == UserBook.id).filter(
+            UserBookTag.user_id == user_id, UserBookTag.tag == tag
+        )
+    if cursor is not None:
+        query = query.filter(UserBook.id < cursor)
+    rows = query.limit(limit + 1).all()
+    next_cursor = rows[limit - 1][0].id if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
 @bp.route("/")
 def home_redirect():
     """Redirect to API endpoint - React frontend handles the UI"""
@@ -15,20 +67,23 @@ def home_redirect():
 @bp.route("/books")
 def books_list():
     """Books list - returns JSON (React frontend handles rendering)"""
+    limit, cursor = _page_args()
+    next_cursor = None
     if current_user.is_authenticated:
         # Get user's books through UserBook relationship
-        links = (
-            db.session.query(UserBook, Book)
-            .join(Book, UserBook.book_id == Book.id)
-            .filter(UserBook.user_id == current_user.id)
-            .order_by(UserBook.id.desc())
-            .all()
-        )
-        books = [book for _, book in links]
+        if limit:
+            links, next_cursor = _library_page(current_user.id, limit, cursor)
+        else:
+            links = _library_query(current_user.id).all()
+        all_tags = library_tags.all_tags(current_user.id)
     else:
-        books = []
-    all_tags = sorted({t.strip() for b in books for t in (b.tags or '').split(',') if t.strip()})
-    return jsonify({"books": [{"id": b.id, "title": b.title, "author": b.author, "isbn": b.isbn, "cover_id": b.cover_id, "tags": b.tags} for b in books], "all_tags": all_tags})
+        links = []
+        all_tags = []
+    # Each entry's own tags, else the book's: the same tags all_tags is built from
+    payload = {"books": [{"id": b.id, "title": b.title, "author": b.author, "isbn": b.isbn, "cover_id": b.cover_id, "tags": link.tags or b.tags or ""} for link, b in links], "all_tags": all_tags}
+    if limit:
+        payload["next_cursor"] = next_cursor
+    return jsonify(payload)
 
 
 @bp.route("/api/search")
@@ -48,11 +103,48 @@ def search_page():
 
 @bp.route('/books/<int:book_id>')
 def book_detail(book_id):
-    b = Book.query.get_or_404(book_id)
-    # If user is logged in, check if they own this book and get their specific data
-    user_data = None
+    details = _book_details([book_id])
+    if book_id not in details:
+        abort(404)
+    # Return JSON instead of template (React frontend handles UI)
+    return jsonify(details[book_id])
+
+
+@bp.route('/api/books/batch')
+def books_batch():
+    """``book_detail`` for many books at once: ``?ids=1,2,3`` (at most ``MAX_BATCH_IDS``).
+
+    Returns ``{"books": [...], "not_found": [...]}`` with books in the order asked for.
+    """
+    try:
+        ids = list(dict.fromkeys(int(i) for i in request.args.get('ids', '').split(',') if i.strip()))
+    except ValueError:
+        return jsonify({"error": "ids must be a comma-separated list of integers"}), 400
+    if not ids:
+        return jsonify({"error": "ids required"}), 400
+    if len(ids) > MAX_BATCH_IDS:
+        return jsonify({"error": f"at most {MAX_BATCH_IDS} ids per request"}), 400
+    details = _book_details(ids)
+    return jsonify({
+        "books": [details[i] for i in ids if i in details],
+        "not_found": [i for i in ids if i not in details],
+    })
+
+
+def _book_details(book_ids):
+    """``book_detail`` payloads by id, with the current user's data, from one outer-joined query."""
     if current_user.is_authenticated:
-        link = UserBook.query.filter_by(user_id=current_user.id, book_id=book_id).first()
+        rows = (
+            db.session.query(Book, UserBook)
+            .outerjoin(UserBook, (UserBook.book_id == Book.id) & (UserBook.user_id == current_user.id))
+            .filter(Book.id.in_(book_ids))
+        )
+    else:
+        rows = ((b, None) for b in Book.query.filter(Book.id.in_(book_ids)))
+    details = {}
+    for b, link in rows:
+        # If the user owns this book, include their specific data
+        user_data = None
         if link:
             user_data = {
                 'status': link.status,
@@ -62,15 +154,24 @@ def book_detail(book_id):
                 'tags': link.tags,
                 'notes': link.notes,
             }
-    # Return JSON instead of template (React frontend handles UI)
-    return jsonify({
-        "id": b.id,
-        "title": b.title,
-        "author": b.author,
-        "isbn": b.isbn,
-        "cover_id": b.cover_id,
-        "user_data": user_data
-    })
+        details[b.id] = {
+            "id": b.id,
+            "title": b.title,
+            "author": b.author,
+            "isbn": b.isbn,
+            "cover_id": b.cover_id,
+            "user_data": user_data
+        }
+    return details
+
+
+def _insert_ignore(model, conflict_columns, values, returning=None):
+    """INSERT ... ON CONFLICT DO NOTHING for the session's database (SQLite or PostgreSQL)."""
+    dialect = postgresql if db.session.get_bind().dialect.name == 'postgresql' else sqlite
+    stmt = dialect.insert(model).values(**values).on_conflict_do_nothing(index_elements=conflict_columns)
+    if returning is not None:
+        stmt = stmt.returning(returning)
+    return db.session.execute(stmt)
 
 
 @bp.route('/api/add_to_library', methods=['POST'])
@@ -84,24 +185,36 @@ def add_to_library():
     if not isbn and (not title or not author):
         return jsonify({"error": "isbn or (title and author) required"}), 400
 
-    # Find or create Book
-    book = None
-    if isbn:
-        book = Book.query.filter_by(isbn=isbn).first()
-    if not book:
+    # Find or create Book, then link it; both upserts share one transaction so
+    # concurrent requests converge on the same rows instead of duplicating them
+    book_id = None
+    isbn13 = to_isbn13(isbn)
+    if isbn13:
+        book_id = db.session.scalar(select(Book.id).where(Book.isbn13 == isbn13).limit(1))
+    if book_id is None:
         if not title or not author:
             return jsonify({"error": "title and author required to create book"}), 400
-        book = Book(title=title, author=author, isbn=isbn, cover_id=cover_id)
-        db.session.add(book)
-        db.session.commit()
+        key = book_key(title, author)
+        # Core insert: set the columns the Book mapper events would derive
+        book_id = _insert_ignore(Book, ['dedupe_key'], {
+            'title': title, 'author': author, 'isbn': isbn or None, 'isbn13': isbn13,
+            'cover_id': cover_id, 'dedupe_key': key,
+        }, returning=Book.id).scalar()
+        if book_id is None:
+            book_id = db.session.scalar(select(Book.id).where(Book.dedupe_key == key))
 
-    link = UserBook.query.filter_by(user_id=current_user.id, book_id=book.id).first()
-    if not link:
-        link = UserBook(user_id=current_user.id, book_id=book.id, status='wishlist')
-        db.session.add(link)
-        db.session.commit()
+    link_id = _insert_ignore(UserBook, ['user_id', 'book_id'], {
+        'user_id': current_user.id, 'book_id': book_id, 'status': 'wishlist',
+    }, returning=UserBook.id).scalar()
+    if link_id is not None:
+        # Core insert: the search/tag/version hooks only see ORM flushes
+        library_search.refresh(db.session.connection(), [link_id])
+        library_tags.refresh(db.session.connection(), [link_id])
+        versions.bump(db.session.connection(), [current_user.id])
+        versions.stamp_links(db.session.connection(), UserBook.id == link_id)
+    db.session.commit()
 
-    return jsonify({"ok": True, "book_id": book.id})
+    return jsonify({"ok": True, "book_id": book_id})
 
 
 @bp.route('/my')
@@ -121,7 +234,7 @@ def books_new():
             return render_template("book_form.html", book=None, title="Add Book")
         
         # Find or create Book
-        book = Book.query.filter_by(title=title, author=author).first()
+        book = Book.query.filter_by(dedupe_key=book_key(title, author)).first()
         if not book:
             book = Book(
                 title=title,
@@ -183,8 +296,14 @@ def books_edit(book_id):
         # Only update Book title/author if no other users have this book
         other_links = UserBook.query.filter(UserBook.book_id == book_id, UserBook.user_id != current_user.id).count()
         if other_links == 0:
-            b.title = request.form.get("title", b.title).strip()
-            b.author = request.form.get("author", b.author).strip()
+            title = request.form.get("title", b.title).strip()
+            author = request.form.get("author", b.author).strip()
+            key = book_key(title, author)
+            if key != b.dedupe_key and Book.query.filter(Book.dedupe_key == key, Book.id != b.id).first():
+                flash("Another book already has that title and author; title and author were not changed.")
+            else:
+                b.title = title
+                b.author = author
         
         db.session.commit()
         flash("Book updated.")
@@ -226,71 +345,152 @@ def books_delete(book_id):
     return redirect(url_for("books.books_list"))
 
 
+def _library_item(link, book):
+    # Use UserBook data (rating, tags, notes) if available, fallback to Book data
+    return {
+        'id': book.id,
+        'title': book.title,
+        'author': book.author,
+        'isbn': book.isbn,
+        'cover_id': book.cover_id,
+        'start_date': link.start_date or book.start_date,
+        'finish_date': link.finish_date or book.finish_date,
+        'rating': link.rating or book.rating,
+        'tags': link.tags or book.tags or '',
+        'notes': link.notes or book.notes or '',
+        'status': link.status,
+    }
+
+
 @bp.route('/api/books.json')
+@versions.conditional_on_library_version
 def api_books_json():
-    """Returns user-specific books if logged in, empty array otherwise"""
+    """Returns user-specific books if logged in, empty array otherwise.
+
+    Pass ``limit`` (and the returned ``next_cursor`` as ``cursor``) to page
+    through large libraries; the response is then ``{"items", "next_cursor"}``.
+    """
+    limit, cursor = _page_args()
     if not current_user.is_authenticated:
-        return jsonify([])
+        return jsonify({"items": [], "next_cursor": None} if limit else [])
     
     # Get user's books through UserBook relationship
-    links = (
-        db.session.query(UserBook, Book)
-        .join(Book, UserBook.book_id == Book.id)
-        .filter(UserBook.user_id == current_user.id)
-        .order_by(UserBook.id.desc())
-        .all()
-    )
+    if limit:
+        links, next_cursor = _library_page(current_user.id, limit, cursor)
+    else:
+        links = _library_query(current_user.id).all()
     
-    payload = []
-    for link, book in links:
-        # Use UserBook data (rating, tags, notes) if available, fallback to Book data
-        payload.append({
-            'id': book.id,
-            'title': book.title,
-            'author': book.author,
-            'isbn': book.isbn,
-            'cover_id': book.cover_id,
-            'start_date': link.start_date or book.start_date,
-            'finish_date': link.finish_date or book.finish_date,
-            'rating': link.rating or book.rating,
-            'tags': link.tags or book.tags or '',
-            'notes': link.notes or book.notes or '',
-            'status': link.status,
-        })
+    payload = [_library_item(link, book) for link, book in links]
+    if limit:
+        return jsonify({"items": payload, "next_cursor": next_cursor})
     return jsonify(payload)
 
 
+@bp.route('/api/library/search')
+@login_required
+def library_search_api():
+    """Ranked full-text search over the user's library (title, author, tags, notes).
+
+    Paginated like ``/api/books.json``: pass the returned ``next_cursor`` as ``cursor``.
+    """
+    q = request.args.get('q', '').strip()
+    limit = max(1, min(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    offset = max(0, request.args.get('cursor', 0, type=int))
+    link_ids, has_more = library_search.search(current_user.id, q, limit, offset)
+    rows = {}
+    if link_ids:
+        rows = {
+            link.id: (link, book)
+            for link, book in _library_query(current_user.id).filter(UserBook.id.in_(link_ids))
+        }
+    items = [_library_item(*rows[link_id]) for link_id in link_ids if link_id in rows]
+    return jsonify({"items": items, "next_cursor": offset + limit if has_more else None})
+
+
+@bp.route('/api/library/tags')
+@login_required
+def library_tag_facets():
+    """Tag facet counts for the user's library: ``{"tags": [{"tag", "count"}]}``, most used first."""
+    return jsonify({"tags": library_tags.facet_counts(current_user.id)})
+
+
+@bp.route('/api/library/tags/<path:tag>')
+@login_required
+def library_tag_books(tag):
+    """Library entries tagged ``tag``, newest first, as ``{"items", "next_cursor"}``."""
+    limit, cursor = _page_args()
+    links, next_cursor = _library_page(current_user.id, limit or DEFAULT_PAGE_SIZE, cursor, tag=tag)
+    return jsonify({"items": [_library_item(link, book) for link, book in links], "next_cursor": next_cursor})
+
+
+def _export_chunks():
+    """Yield lists of export rows, ``EXPORT_CHUNK_SIZE`` at a time.
+
+    ``yield_per`` streams from a server-side cursor where the driver supports
+    it, so only one chunk of rows is held in memory.
+    """
+    stmt = (
+        select(*(getattr(Book, f) for f in EXPORT_FIELDS))
+        .order_by(Book.id.asc())
+        .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    )
+    for partition in db.session.execute(stmt).partitions():
+        yield [dict(zip(EXPORT_FIELDS, row)) for row in partition]
+
+
+def _gzip_stream(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _export_response(chunks, mimetype: str, filename: str, attachment: bool = True) -> Response:
+    """Stream ``chunks`` (an iterable of str), gzip-compressed when ``?gzip=1``."""
+    if request.args.get('gzip', '').lower() in ('1', 'true', 'yes'):
+        return Response(
+            stream_with_context(_gzip_stream(chunks)),
+            mimetype='application/gzip',
+            headers={'Content-Disposition': f'attachment; filename={filename}.gz'},
+        )
+    headers = {'Content-Disposition': f'attachment; filename={filename}'} if attachment else None
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
+
 @bp.route('/export.json')
 def export_json():
     """Legacy endpoint - returns all books (for admin/export purposes)"""
-    books = Book.query.order_by(Book.id.asc()).all()
-    payload = []
-    for b in books:
-        payload.append({
-            'id': b.id,
-            'title': b.title,
-            'author': b.author,
-            'isbn': b.isbn,
-            'cover_id': b.cover_id,
-            'start_date': b.start_date,
-            'finish_date': b.finish_date,
-            'rating': b.rating,
-            'tags': b.tags,
-            'notes': b.notes,
-        })
-    return jsonify(payload)
+    def generate():
+        yield '['
+        first = True
+        for rows in _export_chunks():
+            body = ','.join(json.dumps(r) for r in rows)
+            yield body if first else ',' + body
+            first = False
+        yield ']'
+    return _export_response(generate(), 'application/json', 'books.json', attachment=False)
+
+
+@bp.route('/export.ndjson')
+def export_ndjson():
+    """All books as newline-delimited JSON, one object per line."""
+    def generate():
+        for rows in _export_chunks():
+            yield ''.join(json.dumps(r) + '\n' for r in rows)
+    return _export_response(generate(), 'application/x-ndjson', 'books.ndjson')
 
 
 @bp.route('/api/my.json')
 @login_required
+@versions.conditional_on_library_version
 def my_json():
-    links = (
-        db.session.query(UserBook, Book)
-        .join(Book, UserBook.book_id == Book.id)
-        .filter(UserBook.user_id == current_user.id)
-        .order_by(UserBook.id.desc())
-        .all()
-    )
+    limit, cursor = _page_args()
+    if limit:
+        links, next_cursor = _library_page(current_user.id, limit, cursor)
+    else:
+        links = _library_query(current_user.id).all()
     items = []
     for link, book in links:
         items.append({
@@ -304,43 +504,32 @@ def my_json():
             'status': link.status,
             'rating': link.rating,
         })
+    if limit:
+        return jsonify({"items": items, "next_cursor": next_cursor})
     return jsonify(items)
 
 
 @bp.route('/api/backfill_covers', methods=['POST'])
 @login_required
 def backfill_covers():
-    updated = 0
-    skipped = 0
-    failed = 0
-    books = Book.query.all()
-    for b in books:
-        if b.cover_id or (b.isbn and str(b.isbn).strip()):
-            skipped += 1
-            continue
-        q = f"{b.title} {b.author}".strip()
-        try:
-            r = requests.get('https://openlibrary.org/search.json', params={'q': q, 'limit': 1}, timeout=5)
-            if r.status_code == 200:
-                docs = (r.json() or {}).get('docs') or []
-                if docs:
-                    cid = docs[0].get('cover_i')
-                    if cid:
-                        b.cover_id = int(cid)
-                        updated += 1
-        except Exception:
-            failed += 1
-    if updated:
-        db.session.commit()
-    return jsonify({"updated": updated, "skipped": skipped, "failed": failed})
+    """Start (or resume) the background cover backfill; poll the returned job."""
+    job, created = start_backfill(current_user.id)
+    if created:
+        jobs.submit(current_app._get_current_object(), job.id, run_backfill)
+        db.session.refresh(job)
+    return jsonify({"job": jobs.serialize(job)}), 202
+
+
+@bp.route('/api/backfill_covers/<int:job_id>')
+@login_required
+def backfill_covers_status(job_id):
+    job = Job.query.filter_by(id=job_id, kind=BACKFILL_KIND).first_or_404()
+    return jsonify({"job": jobs.serialize(job)})
 
 
 @bp.route('/export.csv')
 def export_csv():
-    books = Book.query.order_by(Book.id.asc()).all()
-    lines = [
-        'id,title,author,isbn,start_date,finish_date,rating,tags,notes'
-    ]
+    columns = ('id', 'title', 'author', 'isbn', 'start_date', 'finish_date', 'rating', 'tags', 'notes')
     def esc(value: str) -> str:
         if value is None:
             return ''
@@ -348,9 +537,8 @@ def export_csv():
         if any(c in text for c in [',', '"', '\n']):
             return '"' + text.replace('"', '""') + '"'
         return text
-    for b in books:
-        lines.append(','.join([
-            esc(b.id), esc(b.title), esc(b.author), esc(b.isbn), esc(b.start_date), esc(b.finish_date), esc(b.rating), esc(b.tags), esc(b.notes)
-        ]))
-    csv_text = '\n'.join(lines) + '\n'
-    return Response(csv_text, mimetype='text/csv', headers={'Content-Disposition': 'attachment; filename=books.csv'})
+    def generate():
+        yield ','.join(columns) + '\n'
+        for rows in _export_chunks():
+            yield ''.join(','.join(esc(r[c]) for c in columns) + '\n' for r in rows)
+    return _export_response(generate(), 'text/csv', 'books.csv')
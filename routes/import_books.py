@@ -1,10 +1,169 @@
-from flask import Blueprint, request, jsonify
+from datetime import datetime
+from flask import Blueprint, current_app, request, jsonify
 from flask_login import login_required, current_user
-from models import db, Book, UserBook
+from sqlalchemy import insert
+from models import db, book_key, Book, ImportJobRow, Job, UserBook
+from services import jobs
+from services.isbn import to_isbn13
+import csv
+import io
+import json
+import os
 import re
 
 bp = Blueprint('import', __name__, url_prefix='/api/import')
 
+# Keeps each IN (...) well under SQLite's bound-parameter limit
+LOOKUP_CHUNK_SIZE = 500
+IMPORT_JOB_KIND = 'goodreads_import'
+IMPORT_JOB_CHUNK_SIZE = int(os.environ.get("IMPORT_JOB_CHUNK_SIZE", 500))
+MAX_REPORTED_ERRORS = 100
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", 500))
+
+
+def _chunks(values, size=None):
+    size = size or LOOKUP_CHUNK_SIZE
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _iter_chunks(rows, size):
+    """Group any iterable into lists of at most ``size`` items, lazily."""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _lookup_existing(books, user_id):
+    """
+    Resolve a whole payload against the catalog with a few chunked IN queries.
+
+    Returns ``(by_isbn, by_key, owned)``: maps from ISBN-13 and from
+    ``book_key(title, author)`` to the matching book id, and the set of those
+    book ids already in the user's library.
+    """
+    isbns = set()
+    keys = set()
+    for book_data in books:
+        title = book_data.get('title', '').strip()
+        author = book_data.get('author', '').strip()
+        isbn13 = to_isbn13(book_data.get('isbn'))
+        if not title or not author:
+            continue
+        if isbn13:
+            isbns.add(isbn13)
+        keys.add(book_key(title, author))
+
+    by_isbn = {}
+    for chunk in _chunks(isbns):
+        rows = db.session.query(Book.id, Book.isbn13).filter(Book.isbn13.in_(chunk)).order_by(Book.id)
+        for book_id, isbn13 in rows:
+            by_isbn.setdefault(isbn13, book_id)
+
+    by_key = {}
+    for chunk in _chunks(keys):
+        rows = db.session.query(Book.id, Book.dedupe_key).filter(Book.dedupe_key.in_(chunk))
+        by_key.update((key, book_id) for book_id, key in rows)
+
+    owned = set()
+    for chunk in _chunks(set(by_isbn.values()) | set(by_key.values())):
+        rows = db.session.query(UserBook.book_id).filter(
+            UserBook.user_id == user_id, UserBook.book_id.in_(chunk)
+        )
+        owned.update(book_id for (book_id,) in rows)
+    return by_isbn, by_key, owned
+
+
+def _status_from_shelves(shelves):
+    status = 'wishlist'  # default
+    if shelves:
+        shelves_lower = shelves.lower()
+        if any(word in shelves_lower for word in ['read', 'currently-reading']):
+            status = 'completed' if 'read' in shelves_lower else 'reading'
+    return status
+
+
+def _import_rows(books, user_id):
+    """
+    Add Goodreads payload rows to the user's library without committing.
+    New books are inserted in one flush and the links in the next.
+
+    Returns ``(imported, skipped)``.
+    """
+    by_isbn, by_key, owned = _lookup_existing(books, user_id)
+    imported = 0
+    skipped = 0
+    new_books = []
+    pending_links = []
+
+    for book_data in books:
+        title = book_data.get('title', '').strip()
+        author = book_data.get('author', '').strip()
+        isbn = book_data.get('isbn', '').strip()
+        rating = book_data.get('rating', 0) or 0
+        date_read = book_data.get('date_read', '').strip()
+        date_added = book_data.get('date_added', '').strip()
+        shelves = book_data.get('shelves', '').strip()
+        review = book_data.get('review', '').strip()
+
+        if not title or not author:
+            skipped += 1
+            continue
+
+        # Find or create book: an existing book id, or a Book created earlier in this payload
+        book = None
+        isbn13 = to_isbn13(isbn)
+        if isbn13:
+            book = by_isbn.get(isbn13)
+        key = book_key(title, author)
+        if book is None:
+            book = by_key.get(key)
+
+        if book is None:
+            # Create new book
+            book = Book(
+                title=title,
+                author=author,
+                isbn=isbn if isbn else None,
+                rating=rating if rating > 0 else None,
+                notes=review if review else None
+            )
+            new_books.append(book)
+            if isbn13:
+                by_isbn[isbn13] = book
+            by_key[key] = book
+
+        # Check if user already has this book
+        if book in owned:
+            skipped += 1
+            continue
+        owned.add(book)
+
+        pending_links.append((book, {
+            'status': _status_from_shelves(shelves),
+            'rating': rating if rating > 0 else None,
+            'start_date': date_added if date_added else None,
+            'finish_date': date_read if date_read else None,
+            'notes': review if review else None,
+            'tags': shelves if shelves else None,
+        }))
+        imported += 1
+
+    if new_books:
+        db.session.add_all(new_books)
+        db.session.flush()  # Get the IDs
+    db.session.add_all([
+        UserBook(user_id=user_id, book_id=book if isinstance(book, int) else book.id, **fields)
+        for book, fields in pending_links
+    ])
+    return imported, skipped
+
 
 @bp.route('/goodreads/preview', methods=['POST'])
 @login_required
@@ -12,41 +171,36 @@ def preview_goodreads():
     """Preview Goodreads import without actually importing"""
     data = request.get_json(silent=True) or {}
     books = data.get('books', [])
-    
+
     if not books:
         return jsonify({"error": "No books provided"}), 400
-    
+
     duplicates = 0
     new_books = 0
-    
+    by_isbn, by_key, owned = _lookup_existing(books, current_user.id)
+
     for book_data in books:
         title = book_data.get('title', '').strip()
         author = book_data.get('author', '').strip()
         isbn = book_data.get('isbn', '').strip()
-        
+
         if not title or not author:
             continue
-            
+
         # Check if book already exists
         existing = None
-        if isbn:
-            existing = Book.query.filter_by(isbn=isbn).first()
-        if not existing:
-            existing = Book.query.filter_by(title=title, author=author).first()
-            
-        if existing:
-            # Check if user already has this book
-            user_book = UserBook.query.filter_by(
-                user_id=current_user.id, 
-                book_id=existing.id
-            ).first()
-            if user_book:
-                duplicates += 1
-            else:
-                new_books += 1
+        isbn13 = to_isbn13(isbn)
+        if isbn13:
+            existing = by_isbn.get(isbn13)
+        if existing is None:
+            existing = by_key.get(book_key(title, author))
+
+        # Check if user already has this book
+        if existing is not None and existing in owned:
+            duplicates += 1
         else:
             new_books += 1
-    
+
     return jsonify({
         "books": books,
         "duplicates": duplicates,
@@ -60,78 +214,12 @@ def import_goodreads():
     """Import books from Goodreads CSV"""
     data = request.get_json(silent=True) or {}
     books = data.get('books', [])
-    
+
     if not books:
         return jsonify({"error": "No books provided"}), 400
-    
-    imported = 0
-    skipped = 0
-    
-    for book_data in books:
-        title = book_data.get('title', '').strip()
-        author = book_data.get('author', '').strip()
-        isbn = book_data.get('isbn', '').strip()
-        rating = book_data.get('rating', 0) or 0
-        date_read = book_data.get('date_read', '').strip()
-        date_added = book_data.get('date_added', '').strip()
-        shelves = book_data.get('shelves', '').strip()
-        review = book_data.get('review', '').strip()
-        
-        if not title or not author:
-            skipped += 1
-            continue
-            
-        # Find or create book
-        book = None
-        if isbn:
-            book = Book.query.filter_by(isbn=isbn).first()
-        if not book:
-            book = Book.query.filter_by(title=title, author=author).first()
-            
-        if not book:
-            # Create new book
-            book = Book(
-                title=title,
-                author=author,
-                isbn=isbn if isbn else None,
-                rating=rating if rating > 0 else None,
-                notes=review if review else None
-            )
-            db.session.add(book)
-            db.session.flush()  # Get the ID
-        
-        # Check if user already has this book
-        user_book = UserBook.query.filter_by(
-            user_id=current_user.id, 
-            book_id=book.id
-        ).first()
-        
-        if user_book:
-            skipped += 1
-            continue
-            
-        # Determine status from shelves
-        status = 'wishlist'  # default
-        if shelves:
-            shelves_lower = shelves.lower()
-            if any(word in shelves_lower for word in ['read', 'currently-reading']):
-                status = 'completed' if 'read' in shelves_lower else 'reading'
-        
-        # Create user book link
-        user_book = UserBook(
-            user_id=current_user.id,
-            book_id=book.id,
-            status=status,
-            rating=rating if rating > 0 else None,
-            start_date=date_added if date_added else None,
-            finish_date=date_read if date_read else None,
-            notes=review if review else None,
-            tags=shelves if shelves else None
-        )
-        db.session.add(user_book)
-        imported += 1
-    
+
     try:
+        imported, skipped = _import_rows(books, current_user.id)
         db.session.commit()
         return jsonify({
             "imported": imported,
@@ -140,3 +228,224 @@ def import_goodreads():
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": "Failed to import books"}), 500
+
+
+def _import_chunk(job, rows):
+    """
+    Import one chunk of staged rows for ``job``. The chunk is tried as a
+    whole; if that fails each row is retried on its own so one bad row only
+    fails itself. Returns the staged rows that failed.
+    """
+    failed_rows = []
+    valid = []
+    for staged in rows:
+        book_data = json.loads(staged.data)
+        if not (book_data.get('title') or '').strip() or not (book_data.get('author') or '').strip():
+            staged.error = 'title and author are required'
+            failed_rows.append(staged)
+        else:
+            valid.append((staged, book_data))
+
+    try:
+        with db.session.begin_nested():
+            imported, skipped = _import_rows([b for _, b in valid], job.user_id)
+    except Exception:
+        imported = skipped = 0
+        for staged, book_data in valid:
+            try:
+                with db.session.begin_nested():
+                    row_imported, row_skipped = _import_rows([book_data], job.user_id)
+                imported += row_imported
+                skipped += row_skipped
+            except Exception as exc:
+                staged.error = str(exc)[:500]
+                failed_rows.append(staged)
+
+    job.succeeded += imported
+    job.skipped += skipped
+    job.failed += len(failed_rows)
+    return failed_rows
+
+
+def run_import_job(job_id):
+    """Process a queued import job chunk by chunk, one transaction per chunk."""
+    job = db.session.get(Job, job_id)
+    job.status = 'running'
+    db.session.commit()
+    while True:
+        rows = (
+            ImportJobRow.query
+            .filter(ImportJobRow.job_id == job.id, ImportJobRow.row_number > (job.last_id or 0))
+            .order_by(ImportJobRow.row_number.asc())
+            .limit(IMPORT_JOB_CHUNK_SIZE)
+            .all()
+        )
+        if not rows:
+            break
+        failed_rows = _import_chunk(job, rows)
+        # Keep only the rows that failed, for the error report
+        failed_ids = {r.id for r in failed_rows}
+        for staged in rows:
+            if staged.id not in failed_ids:
+                db.session.delete(staged)
+        job.processed += len(rows)
+        job.last_id = rows[-1].row_number
+        db.session.commit()
+    job.status = 'completed'
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+
+@bp.route('/goodreads/jobs', methods=['POST'])
+@login_required
+def create_import_job():
+    """Queue a Goodreads import to run in the background; poll /api/import/jobs/<id>"""
+    data = request.get_json(silent=True) or {}
+    books = data.get('books', [])
+
+    if not books:
+        return jsonify({"error": "No books provided"}), 400
+
+    return _queue_import_job(books)
+
+
+def _queue_import_job(books):
+    """Stage ``books`` (any iterable of payload rows) chunk by chunk and queue the job."""
+    job = Job(kind=IMPORT_JOB_KIND, user_id=current_user.id, status='queued', total=0)
+    db.session.add(job)
+    db.session.flush()
+    for chunk in _iter_chunks(books, IMPORT_JOB_CHUNK_SIZE):
+        db.session.execute(insert(ImportJobRow), [
+            {'job_id': job.id, 'row_number': job.total + i + 1, 'data': json.dumps(book_data)}
+            for i, book_data in enumerate(chunk)
+        ])
+        job.total += len(chunk)
+    db.session.commit()
+
+    jobs.submit(current_app._get_current_object(), job.id, run_import_job)
+    db.session.refresh(job)
+    return jsonify({"job": jobs.serialize(job)}), 202
+
+
+@bp.route('/jobs/<int:job_id>')
+@login_required
+def import_job_status(job_id):
+    job = Job.query.filter_by(id=job_id, kind=IMPORT_JOB_KIND, user_id=current_user.id).first_or_404()
+    if jobs.expire_if_stale(job):
+        db.session.commit()
+    errors = (
+        ImportJobRow.query
+        .filter(ImportJobRow.job_id == job.id, ImportJobRow.error.isnot(None))
+        .order_by(ImportJobRow.row_number.asc())
+        .limit(MAX_REPORTED_ERRORS)
+        .all()
+    )
+    return jsonify({
+        "job": jobs.serialize(job),
+        "errors": [{"row": e.row_number, "error": e.error} for e in errors],
+        # Staged rows after last_id are still waiting; POST .../resume picks them up
+        "resumable": job.status == 'failed' and job.processed < (job.total or 0),
+    })
+
+
+@bp.route('/jobs/<int:job_id>/resume', methods=['POST'])
+@login_required
+def resume_import_job(job_id):
+    """Re-queue a failed or interrupted import; it continues after ``last_id``."""
+    job = Job.query.filter_by(id=job_id, kind=IMPORT_JOB_KIND, user_id=current_user.id).first_or_404()
+    if jobs.expire_if_stale(job):
+        db.session.commit()
+    if jobs.is_active(job):
+        return jsonify({"job": jobs.serialize(job)}), 202
+    if job.status != 'failed':
+        return jsonify({"error": "Job already completed"}), 409
+    # Only one of several concurrent resumes moves the job out of 'failed'
+    claimed = (
+        Job.query.filter_by(id=job.id, status='failed')
+        .update({'status': 'queued', 'error': None, 'finished_at': None}, synchronize_session=False)
+    )
+    db.session.commit()
+    if claimed:
+        jobs.submit(current_app._get_current_object(), job.id, run_import_job)
+    db.session.refresh(job)
+    return jsonify({"job": jobs.serialize(job)}), 202
+
+
+def _goodreads_value(value):
+    # Goodreads wraps ISBNs as ="0451526538" to stop spreadsheets mangling them
+    value = (value or '').strip()
+    if value.startswith('="') and value.endswith('"'):
+        value = value[2:-1]
+    return value.strip()
+
+
+def _read_goodreads_csv(stream):
+    """
+    Parse a Goodreads export incrementally, yielding payload rows in the
+    shape the frontend posts (title, author, isbn, rating, ...).
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    reader = csv.reader(text)
+    headers = [h.strip().lower() for h in next(reader, [])]
+
+    def column(match, exclude=None):
+        return next((i for i, h in enumerate(headers) if match in h and not (exclude and exclude in h)), None)
+
+    columns = {
+        'title': column('title'),
+        'author': column('author'),
+        'isbn': column('isbn'),
+        'rating': column('rating', exclude='average'),
+        'date_read': column('date read'),
+        'date_added': column('date added'),
+        'shelves': column('shelves'),
+        'review': column('review'),
+    }
+    for fields in reader:
+        row = {
+            key: _goodreads_value(fields[index]) if index is not None and index < len(fields) else ''
+            for key, index in columns.items()
+        }
+        try:
+            row['rating'] = int(row['rating'] or 0)
+        except ValueError:
+            row['rating'] = 0
+        yield row
+
+
+@bp.route('/goodreads/upload', methods=['POST'])
+@login_required
+def upload_goodreads():
+    """
+    Import a raw Goodreads CSV, sent as a multipart ``file`` field or as a
+    ``text/csv`` body. Rows are parsed as they stream in and imported
+    ``UPLOAD_CHUNK_SIZE`` at a time, one commit per chunk. With
+    ``?background=1`` the rows are staged for a background import job instead.
+    """
+    upload = request.files.get('file')
+    if upload is not None:
+        stream = upload.stream
+    elif request.mimetype == 'text/csv':
+        stream = io.BufferedReader(request.stream)
+    else:
+        return jsonify({"error": "CSV file required"}), 400
+
+    rows = _read_goodreads_csv(stream)
+    if request.args.get('background', '').lower() in ('1', 'true', 'yes'):
+        return _queue_import_job(rows)
+
+    imported = 0
+    skipped = 0
+    try:
+        for chunk in _iter_chunks(rows, UPLOAD_CHUNK_SIZE):
+            chunk_imported, chunk_skipped = _import_rows(chunk, current_user.id)
+            db.session.commit()
+            imported += chunk_imported
+            skipped += chunk_skipped
+    except Exception:
+        db.session.rollback()
+        return jsonify({"error": "Failed to import books", "imported": imported, "skipped": skipped}), 500
+    return jsonify({
+        "imported": imported,
+        "skipped": skipped
+    })
@@ -0,0 +1,65 @@
+from flask import Blueprint, jsonify, request
+from flask_login import login_required, current_user
+
+from models import db, Book, Tombstone, User, UserBook, VocabEntry
+from routes.books import _library_item
+
+bp = Blueprint('sync', __name__)
+
+
+def _vocab_item(e):
+    return {
+        'id': e.id,
+        'book_id': e.book_id,
+        'word': e.word,
+        'definition': e.definition,
+        'quote': e.quote,
+        'srs_box': e.srs_box,
+        'next_review_at': (e.next_review_at.isoformat() if e.next_review_at else None),
+    }
+
+
+@bp.route('/api/sync')
+@login_required
+def sync():
+    """Library and vocabulary changes since ``since`` (a token from an earlier call).
+
+    Without ``since`` (or with 0) everything is returned (``"full": true``).
+    Otherwise only rows created or updated after the token, plus the ids of
+    deleted ones (apply those first: a book can be removed and re-added
+    between calls). Clients store the returned ``token`` for the next call.
+    """
+    since = max(0, request.args.get('since', 0, type=int))
+    # Read the token first: anything committed after this is sent again next time
+    token = db.session.scalar(db.select(User.library_version).where(User.id == current_user.id)) or 0
+    if since > token:
+        return jsonify({"error": "unknown sync token"}), 400
+
+    links = (
+        db.session.query(UserBook, Book)
+        .join(Book, UserBook.book_id == Book.id)
+        .filter(UserBook.user_id == current_user.id)
+    )
+    entries = VocabEntry.query.filter(VocabEntry.user_id == current_user.id)
+    deleted = {'books': [], 'vocab': []}
+    if since:
+        links = links.filter(UserBook.version > since)
+        entries = entries.filter(VocabEntry.version > since)
+        tombstones = (
+            db.session.query(Tombstone.kind, Tombstone.row_id, Tombstone.book_id)
+            .filter(Tombstone.user_id == current_user.id, Tombstone.version > since)
+            .order_by(Tombstone.version)
+        )
+        for kind, row_id, book_id in tombstones:
+            if kind == 'user_book':
+                deleted['books'].append(book_id)
+            else:
+                deleted['vocab'].append(row_id)
+
+    return jsonify({
+        "token": token,
+        "full": not since,
+        "books": [_library_item(link, book) for link, book in links.order_by(UserBook.id.desc())],
+        "vocab": [_vocab_item(e) for e in entries.order_by(VocabEntry.id)],
+        "deleted": deleted,
+    })
@@ -1,18 +1,20 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
 
-from flask import Blueprint, jsonify, request, render_template, redirect, url_for, flash
+import numpy as np
+
+from flask import Blueprint, current_app, jsonify, request, render_template, redirect, url_for, flash
 from flask_login import login_required, current_user
+from sqlalchemy import and_, or_, update
 
 from models import db, VocabEntry, Book
+from services import forecast, review_log, scheduling, versions
 
 
 bp = Blueprint('vocab', __name__, url_prefix='/vocab')
 
-
-def _default_next_review(box: int) -> datetime:
-    intervals = {1: 1, 2: 2, 3: 5, 4: 10, 5: 20}
-    days = intervals.get(max(1, min(5, box)), 1)
-    return datetime.utcnow() + timedelta(days=days)
+DUE_PAGE_SIZE = 100
+MAX_DUE_PAGE_SIZE = 500
+MAX_ANSWER_BATCH = 500
 
 
 @bp.route('/book/<int:book_id>')
@@ -99,9 +101,54 @@ def delete_entry(entry_id: int):
     return jsonify({"ok": True})
 
 
+def _due_cursor(entry):
+    due = entry.next_review_at.isoformat() if entry.next_review_at else 'new'
+    return f"{due}|{entry.id}"
+
+
+def _due_page(query, limit, cursor, now):
+    """
+    Cards due for review, new (never scheduled) ones first, then by due
+    date, as ``(entries, next_cursor)``. Each part is a range scan over the
+    ``(user_id[, book_id], next_review_at, id)`` index; ``cursor`` resumes
+    after the last card of the previous page.
+    """
+    due_after, after_id = None, 0
+    if cursor:
+        due, _, last_id = cursor.rpartition('|')
+        after_id = int(last_id)
+        if due != 'new':
+            due_after = datetime.fromisoformat(due)
+    entries = []
+    if due_after is None:
+        entries = (
+            query.filter(VocabEntry.next_review_at.is_(None), VocabEntry.id > after_id)
+            .order_by(VocabEntry.id.asc())
+            .limit(limit + 1)
+            .all()
+        )
+        after_id = 0
+    if len(entries) <= limit:
+        scheduled = query.filter(VocabEntry.next_review_at <= now)
+        if due_after is not None:
+            scheduled = scheduled.filter(or_(
+                VocabEntry.next_review_at > due_after,
+                and_(VocabEntry.next_review_at == due_after, VocabEntry.id > after_id),
+            ))
+        entries += (
+            scheduled.order_by(VocabEntry.next_review_at.asc(), VocabEntry.id.asc())
+            .limit(limit + 1 - len(entries))
+            .all()
+        )
+    next_cursor = _due_cursor(entries[limit - 1]) if len(entries) > limit else None
+    return entries[:limit], next_cursor
+
+
 @bp.route('/review/queue')
 @login_required
 def review_queue():
+    """Cards to review. ``mode=due`` returns only cards that are due, in due
+    order, ``limit`` at a time; pass the returned ``next_cursor`` as ``cursor``."""
     book_id = request.args.get('book_id', type=int)
     
     # Build query - show ALL vocabulary entries for review
@@ -114,12 +161,21 @@ def review_queue():
     if book_id:
         query = query.filter(VocabEntry.book_id == book_id)
     
-    queue = (
-        query
-        .order_by(VocabEntry.srs_box.asc(), VocabEntry.word.asc())
-        .limit(100)  # Increased limit
-        .all()
-    )
+    due_mode = request.args.get('mode') == 'due'
+    next_cursor = None
+    if due_mode:
+        try:
+            limit = max(1, min(request.args.get('limit', DUE_PAGE_SIZE, type=int), MAX_DUE_PAGE_SIZE))
+            queue, next_cursor = _due_page(query, limit, request.args.get('cursor'), datetime.utcnow())
+        except ValueError:
+            return jsonify({"error": "invalid cursor"}), 400
+    else:
+        queue = (
+            query
+            .order_by(VocabEntry.srs_box.asc(), VocabEntry.word.asc())
+            .limit(100)  # Increased limit
+            .all()
+        )
     if request.args.get('format') == 'json':
         # Get book titles for context
         book_ids = {e.book_id for e in queue}
@@ -129,7 +185,7 @@ def review_queue():
             book_records = Book.query.filter(Book.id.in_(book_ids)).all()
             books = {b.id: {"title": b.title, "author": b.author} for b in book_records}
         
-        return jsonify({
+        payload = {
             "entries": [
                 {
                     "id": e.id,
@@ -140,15 +196,20 @@ def review_queue():
                     "book_id": e.book_id,
                     "book_title": books.get(e.book_id, {}).get("title", f"Book #{e.book_id}"),
                     "book_author": books.get(e.book_id, {}).get("author", ""),
+                    "next_review_at": (e.next_review_at.isoformat() if e.next_review_at else None),
                 }
                 for e in queue
             ]
-        })
+        }
+        if due_mode:
+            payload["next_cursor"] = next_cursor
+        return jsonify(payload)
     return render_template('review.html', entries=queue, title='Flashcard Review')
 
 
 @bp.route('/review/books')
 @login_required
+@versions.conditional_on_library_version
 def review_books():
     """Get books that have vocabulary entries for review filtering"""
     from models import Book
@@ -168,6 +229,21 @@ def review_books():
     })
 
 
+@bp.route('/review/forecast')
+@login_required
+def review_forecast():
+    """
+    Cards coming due per day for the next ``days`` days (default 30, at most
+    90). ``mode=simulate`` instead projects the reviews each day will bring,
+    re-reviews included, over ``runs`` Monte Carlo simulations.
+    """
+    days = max(1, min(request.args.get('days', forecast.DEFAULT_DAYS, type=int), forecast.MAX_DAYS))
+    if request.args.get('mode') == 'simulate':
+        runs = max(1, min(request.args.get('runs', forecast.DEFAULT_RUNS, type=int), forecast.MAX_RUNS))
+        return jsonify({"mode": "simulate", **forecast.simulated_forecast(current_user, days, runs)})
+    return jsonify({"mode": "due", **forecast.forecast(current_user.id, days)})
+
+
 @bp.route('/review/<int:entry_id>/answer', methods=['POST'])
 @login_required
 def submit_answer(entry_id: int):
@@ -175,13 +251,169 @@ def submit_answer(entry_id: int):
     entry = VocabEntry.query.get_or_404(entry_id)
     if entry.user_id != current_user.id:
         return jsonify({"error": "forbidden"}), 403
-    if correctness == 'correct':
-        entry.srs_box = min(5, (entry.srs_box or 1) + 1)
-    else:
-        entry.srs_box = 1
-    entry.next_review_at = _default_next_review(entry.srs_box)
+    scheduler = scheduling.get_scheduler(current_user.srs_algorithm)
+    answered_at = datetime.utcnow()
+    logged = review_log.log_row(
+        current_user.id, entry.id, entry.book_id, entry.srs_box, correctness == 'correct', answered_at,
+        entry.interval_days, entry.last_reviewed_at, scheduler.name,
+    )
+    scheduling.review_entry(entry, correctness == 'correct', answered_at, scheduler)
     db.session.commit()
+    review_log.buffer.add(current_app._get_current_object(), [logged])
     flash('Answer recorded.')
     return redirect(url_for('vocab.review_queue'))
 
 
+def _parse_answered_at(value):
+    if not value:
+        return datetime.utcnow()
+    answered_at = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if answered_at.tzinfo is not None:
+        answered_at = answered_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return answered_at
+
+
+@bp.route('/review/answers', methods=['POST'])
+@login_required
+def submit_answers():
+    """
+    Apply a review session's answers at once:
+    ``{"answers": [{"entry_id", "result": "correct"|"incorrect", "answered_at"?}]}``.
+
+    Answers are applied in ``answered_at`` order and scheduled from that time,
+    with one bulk UPDATE in one transaction. Returns the new schedule of every
+    answered card plus the ids that are not the user's cards.
+    """
+    answers = (request.get_json(silent=True) or {}).get('answers')
+    if not isinstance(answers, list) or not answers:
+        return jsonify({"error": "answers required"}), 400
+    if len(answers) > MAX_ANSWER_BATCH:
+        return jsonify({"error": f"at most {MAX_ANSWER_BATCH} answers per request"}), 400
+    try:
+        parsed = sorted(
+            (
+                (_parse_answered_at(a.get('answered_at')), int(a['entry_id']), a['result'])
+                for a in answers
+            ),
+            key=lambda answer: answer[0],
+        )
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return jsonify({"error": "each answer needs entry_id, result and an optional ISO answered_at"}), 400
+    if any(result not in ('correct', 'incorrect') for _, _, result in parsed):
+        return jsonify({"error": "result must be 'correct' or 'incorrect'"}), 400
+
+    entry_ids = {entry_id for _, entry_id, _ in parsed}
+    rows = (
+        db.session.query(
+            VocabEntry.id, VocabEntry.book_id, *(getattr(VocabEntry, name) for name in scheduling.STATE_COLUMNS),
+        )
+        .filter(VocabEntry.user_id == current_user.id, VocabEntry.id.in_(entry_ids))
+        .all()
+    )
+    positions = {row[0]: i for i, row in enumerate(rows)}
+    state = scheduling.states_from_rows([row[2:] for row in rows])
+    # Round k holds every card's k-th answer, so each round is one vectorized review
+    rounds = []
+    answered = {}
+    for answered_at, entry_id, result in parsed:
+        if entry_id not in positions:
+            continue
+        k = answered.get(entry_id, 0)
+        answered[entry_id] = k + 1
+        if k == len(rounds):
+            rounds.append([])
+        rounds[k].append((positions[entry_id], result == 'correct', answered_at))
+    scheduler = scheduling.get_scheduler(current_user.srs_algorithm)
+    logged = []
+    for answers_in_round in rounds:
+        index, correct, answered_at = (list(column) for column in zip(*answers_in_round))
+        before = scheduling.take(state, index)
+        previous = scheduling.rows_from_state(before)
+        logged += [
+            review_log.log_row(
+                current_user.id, rows[i][0], rows[i][1], box, ok, at, interval, last, scheduler.name,
+            )
+            for i, ok, at, box, interval, last in zip(
+                index, correct, answered_at,
+                previous['srs_box'], previous['interval_days'], previous['last_reviewed_at'],
+            )
+        ]
+        reviewed = scheduler.review(before, correct, np.array(answered_at, dtype='datetime64[s]'))
+        scheduling.put(state, index, reviewed)
+    columns = scheduling.rows_from_state(state)
+    schedule = {
+        row[0]: {name: columns[name][i] for name in scheduling.STATE_COLUMNS}
+        for i, row in enumerate(rows) if row[0] in answered
+    }
+
+    if schedule:
+        # Bulk UPDATE by primary key skips the flush hook, so bump and stamp the library version here
+        version = versions.bump(db.session.connection(), [current_user.id])[current_user.id]
+        now = datetime.utcnow()
+        db.session.execute(update(VocabEntry), [
+            {'id': entry_id, **fields, 'version': version, 'updated_at': now}
+            for entry_id, fields in schedule.items()
+        ])
+    db.session.commit()
+    if logged:
+        review_log.buffer.add(current_app._get_current_object(), logged)
+    return jsonify({
+        "updated": [
+            {"id": entry_id, "srs_box": fields['srs_box'], "next_review_at": fields['next_review_at'].isoformat()}
+            for entry_id, fields in schedule.items()
+        ],
+        "not_found": sorted(entry_ids - set(positions)),
+    })
+
+
+@bp.route('/review/scheduler', methods=['GET', 'POST'])
+@login_required
+def review_scheduler():
+    """
+    The user's scheduling algorithm. POST ``{"algorithm": "leitner"|"sm2"|"fsrs"}``
+    (or null for the default) switches it and reschedules every reviewed card.
+    """
+    rescheduled = 0
+    if request.method == 'POST':
+        algorithm = (request.get_json(silent=True) or {}).get('algorithm')
+        if algorithm is not None and algorithm not in scheduling.SCHEDULERS:
+            return jsonify({"error": f"algorithm must be one of {', '.join(scheduling.SCHEDULERS)}"}), 400
+        current_user.srs_algorithm = algorithm
+        db.session.flush()
+        rescheduled = scheduling.reschedule(db.session.connection(), current_user.id)
+        db.session.commit()
+    return jsonify({
+        "algorithm": scheduling.get_scheduler(current_user.srs_algorithm).name,
+        "algorithms": list(scheduling.SCHEDULERS),
+        "rescheduled": rescheduled,
+    })
+
+
+def _retention_days():
+    return max(1, min(
+        request.args.get('days', review_log.DEFAULT_RETENTION_DAYS, type=int), review_log.MAX_RETENTION_DAYS,
+    ))
+
+
+@bp.route('/review/retention/box')
+@login_required
+def retention_by_box():
+    """Share of correct answers per Leitner box over the last ``days`` days."""
+    review_log.buffer.flush()
+    return jsonify({"boxes": review_log.retention_by_box(current_user.id, _retention_days())})
+
+
+@bp.route('/review/retention/book')
+@login_required
+def retention_by_book():
+    """Share of correct answers per book over the last ``days`` days."""
+    review_log.buffer.flush()
+    return jsonify({"books": review_log.retention_by_book(current_user.id, _retention_days())})
+
+
+@bp.route('/review/retention/day')
+@login_required
+def retention_by_day():
+    """Share of correct answers per (UTC) day over the last ``days`` days."""
+    review_log.buffer.flush()
+    return jsonify({"days": review_log.retention_by_day(current_user.id, _retention_days())})
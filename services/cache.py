@@ -0,0 +1,133 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional, Tuple
+
+from prometheus_client import Counter
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "instance", "cache.sqlite3"
+)
+CACHE_DB_PATH = os.environ.get("CACHE_DB_PATH") or DEFAULT_CACHE_PATH
+
+CACHE_HITS = Counter("cache_hits_total", "Shared cache lookups served from the cache", ["cache"])
+CACHE_STALE_HITS = Counter("cache_stale_hits_total", "Cache hits served stale while revalidating", ["cache"])
+CACHE_MISSES = Counter("cache_misses_total", "Shared cache lookups that missed", ["cache"])
+CACHE_EVICTIONS = Counter("cache_evictions_total", "Entries evicted from the shared cache (LRU)", ["cache"])
+
+FRESH = "fresh"
+STALE = "stale"
+
+
+class SQLiteCache:
+    """
+    Key/value cache stored in a local SQLite file.
+
+    Every gunicorn worker opening the same file sees the same entries. Values
+    are JSON-encoded; entries expire after ``ttl_seconds`` but may still be
+    served as stale for ``stale_seconds`` more. The least recently used entries
+    are evicted once a namespace holds more than ``max_entries``.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        ttl_seconds: Optional[float] = None,
+        stale_seconds: float = 0,
+        max_entries: Optional[int] = None,
+        path: Optional[str] = None,
+    ) -> None:
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.max_entries = max_entries
+        self.path = path or CACHE_DB_PATH
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " stored_at REAL NOT NULL, accessed_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_cache_entries_lru ON cache_entries (namespace, accessed_at)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Tuple[Any, Optional[str]]:
+        """
+        Look up ``key``. Returns ``(value, state)`` where state is ``"fresh"``,
+        ``"stale"`` or ``None`` on a miss.
+        """
+        now = time.time()
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                "SELECT value, stored_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+            if row is None:
+                CACHE_MISSES.labels(self.namespace).inc()
+                return None, None
+            value, stored_at = row
+            age = now - stored_at
+            if self.ttl_seconds is not None and age > self.ttl_seconds + self.stale_seconds:
+                CACHE_MISSES.labels(self.namespace).inc()
+                return None, None
+            conn.execute(
+                "UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                (now, self.namespace, key),
+            )
+        except sqlite3.Error:
+            CACHE_MISSES.labels(self.namespace).inc()
+            return None, None
+        if self.ttl_seconds is not None and age > self.ttl_seconds:
+            CACHE_STALE_HITS.labels(self.namespace).inc()
+            return json.loads(value), STALE
+        CACHE_HITS.labels(self.namespace).inc()
+        return json.loads(value), FRESH
+
+    def set(self, key: str, value: Any) -> None:
+        now = time.time()
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (namespace, key, value, stored_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value), now, now),
+            )
+            if self.max_entries is not None:
+                self._evict(conn)
+        except sqlite3.Error:
+            pass
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        (count,) = conn.execute(
+            "SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (self.namespace,)
+        ).fetchone()
+        excess = count - self.max_entries
+        if excess <= 0:
+            return
+        cur = conn.execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND key IN ("
+            " SELECT key FROM cache_entries WHERE namespace = ? ORDER BY accessed_at ASC LIMIT ?)",
+            (self.namespace, self.namespace, excess),
+        )
+        CACHE_EVICTIONS.labels(self.namespace).inc(cur.rowcount)
+
+    def clear(self) -> None:
+        try:
+            self._conn().execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+        except sqlite3.Error:
+            pass
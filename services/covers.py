@@ -0,0 +1,126 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import func, or_, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Book, Job
+from services import http, jobs, versions
+from services.isbn import OPENLIBRARY_URL
+
+BACKFILL_KIND = 'backfill_covers'
+BACKFILL_CONCURRENCY = int(os.environ.get("BACKFILL_CONCURRENCY", 4))
+BACKFILL_BATCH_SIZE = int(os.environ.get("BACKFILL_BATCH_SIZE", 100))
+OPENLIBRARY_RATE_LIMIT = float(os.environ.get("OPENLIBRARY_RATE_LIMIT", 5))  # requests per second
+
+_rate_limiter = http.HostRateLimiter(OPENLIBRARY_RATE_LIMIT)
+
+
+def _needs_cover():
+    # Books with an ISBN get their cover from the ISBN, so only title+author ones are searched
+    return (Book.cover_id.is_(None), or_(Book.isbn.is_(None), func.trim(Book.isbn) == ''))
+
+
+def lookup_cover_id(title: str, author: str, timeout_seconds: float = 5.0) -> Optional[int]:
+    """
+    Return the Open Library cover id of the best title+author match, or None.
+    Network errors propagate so callers can count them as failures.
+    """
+    q = f"{title} {author}".strip()
+    r = http.get(
+        f"{OPENLIBRARY_URL}/search.json",
+        params={'q': q, 'limit': 1},
+        timeout=timeout_seconds,
+        rate_limiter=_rate_limiter,
+    )
+    if r.status_code != 200:
+        return None
+    docs = (r.json() or {}).get('docs') or []
+    if docs and docs[0].get('cover_i'):
+        return int(docs[0]['cover_i'])
+    return None
+
+
+def start_backfill(user_id: int) -> Tuple[Job, bool]:
+    """
+    Create a backfill job and return ``(job, created)``. If a backfill is
+    already active it is returned instead; an unfinished earlier run is
+    resumed after its last processed book id.
+    """
+    previous = Job.query.filter_by(kind=BACKFILL_KIND).order_by(Job.id.desc()).first()
+    if previous is not None and jobs.is_active(previous):
+        return previous, False
+    resume_after = None
+    if previous is not None and previous.status != 'completed':
+        resume_after = previous.last_id
+        if previous.status in ('queued', 'running'):
+            previous.status = 'failed'
+            previous.error = 'interrupted'
+            # Free the active-backfill slot before the new job takes it
+            db.session.flush()
+    total = Book.query.filter(*_needs_cover(), Book.id > (resume_after or 0)).count()
+    job = Job(kind=BACKFILL_KIND, user_id=user_id, status='queued', total=total, last_id=resume_after)
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent request queued a backfill first (ix_job_active_backfill_covers)
+        db.session.rollback()
+        return _active_backfill(), False
+    return job, True
+
+
+def _active_backfill() -> Optional[Job]:
+    return (
+        Job.query.filter(Job.kind == BACKFILL_KIND, Job.status.in_(('queued', 'running')))
+        .order_by(Job.id.desc())
+        .first()
+    )
+
+
+def run_backfill(job_id: int) -> None:
+    """
+    Look up covers for ``BACKFILL_BATCH_SIZE`` books at a time on a bounded
+    thread pool, committing the cover ids together with the job's progress
+    after each batch.
+    """
+    job = db.session.get(Job, job_id)
+    job.status = 'running'
+    db.session.commit()
+
+    with ThreadPoolExecutor(max_workers=BACKFILL_CONCURRENCY) as pool:
+        while True:
+            batch = (
+                db.session.query(Book.id, Book.title, Book.author)
+                .filter(*_needs_cover(), Book.id > (job.last_id or 0))
+                .order_by(Book.id.asc())
+                .limit(BACKFILL_BATCH_SIZE)
+                .all()
+            )
+            if not batch:
+                break
+            futures = [pool.submit(lookup_cover_id, title, author) for _, title, author in batch]
+            updates = []
+            for (book_id, _, _), future in zip(batch, futures):
+                job.processed += 1
+                try:
+                    cover_id = future.result()
+                except Exception:
+                    job.failed += 1
+                    continue
+                if cover_id:
+                    updates.append({'id': book_id, 'cover_id': cover_id})
+                else:
+                    job.skipped += 1
+            if updates:
+                db.session.execute(update(Book), updates)
+                versions.bump_for_books(db.session.connection(), [u['id'] for u in updates])
+            job.succeeded += len(updates)
+            job.last_id = batch[-1][0]
+            db.session.commit()
+
+    job.status = 'completed'
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
@@ -0,0 +1,133 @@
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+
+import numpy as np
+from sqlalchemy import func, or_
+
+from models import db, VocabEntry
+from services.cache import SQLiteCache
+from services.scheduling import LEITNER_INTERVALS, MAX_BOX
+
+DEFAULT_DAYS = 30
+MAX_DAYS = 90
+DEFAULT_RUNS = 200
+MAX_RUNS = 1000
+# Chance of answering correctly, by Leitner box (index 0 unused)
+SIMULATED_RECALL = np.array([0, 0.7, 0.8, 0.85, 0.9, 0.95])
+
+FORECAST_CACHE_TTL = float(os.environ.get("FORECAST_CACHE_TTL", 24 * 3600))
+FORECAST_CACHE_MAX_ENTRIES = int(os.environ.get("FORECAST_CACHE_MAX_ENTRIES", 10000))
+
+# Keyed by the user's library version, so entries go stale as soon as the deck changes
+forecast_cache = SQLiteCache(
+    "review_forecast",
+    ttl_seconds=FORECAST_CACHE_TTL,
+    max_entries=FORECAST_CACHE_MAX_ENTRIES,
+)
+
+
+def _due_counts(user_id: int, start: date, days: int, by_box: bool = False):
+    """
+    Cards due before ``start + days``, grouped by due date (and box): one
+    aggregate over the ``(user_id, next_review_at)`` index. Rows are
+    ``(day, [box,] count)``; ``day`` is None for never scheduled cards.
+    """
+    day = func.date(VocabEntry.next_review_at)
+    columns = [day, VocabEntry.srs_box] if by_box else [day]
+    end = datetime.combine(start + timedelta(days=days), datetime.min.time())
+    rows = (
+        db.session.query(*columns, func.count())
+        .filter(
+            VocabEntry.user_id == user_id,
+            or_(VocabEntry.next_review_at.is_(None), VocabEntry.next_review_at < end),
+        )
+        .group_by(*columns)
+        .all()
+    )
+    # SQLite returns the date as text, PostgreSQL as a date
+    return [(date.fromisoformat(str(row[0])) if row[0] is not None else None, *row[1:]) for row in rows]
+
+
+def forecast(user_id: int, days: int = DEFAULT_DAYS, today: Optional[date] = None) -> Dict:
+    """Cards coming due on each of the next ``days`` days (UTC), plus the
+    overdue and never reviewed ones."""
+    today = today or datetime.utcnow().date()
+    due = np.zeros(days, dtype=np.int64)
+    overdue = new = 0
+    for day, count in _due_counts(user_id, today, days):
+        if day is None:
+            new += count
+        elif day < today:
+            overdue += count
+        else:
+            due[(day - today).days] += count
+    return {
+        "days": [
+            {"date": (today + timedelta(days=i)).isoformat(), "due": int(n)} for i, n in enumerate(due)
+        ],
+        "overdue": overdue,
+        "new": new,
+    }
+
+
+def simulate(pending: np.ndarray, runs: int, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """
+    Monte Carlo projection of Leitner reviews. ``pending[box, day]`` counts
+    the cards due on each day of the horizon; every day's cards are answered
+    (correct with ``SIMULATED_RECALL[box]``) and moved to their next box and
+    due day, for all runs at once. Returns reviews per run and day.
+    """
+    rng = rng or np.random.default_rng()
+    boxes, days = pending.shape
+    # The extra last day collects cards that fall beyond the horizon
+    state = np.zeros((runs, boxes, days + 1), dtype=np.int64)
+    state[:, :, :days] = pending
+    intervals = LEITNER_INTERVALS.astype(np.int64)
+    promoted = np.minimum(np.arange(boxes) + 1, MAX_BOX)
+    reviews = np.zeros((runs, days), dtype=np.int64)
+    for day in range(days):
+        answered = state[:, :, day]
+        reviews[:, day] = answered.sum(axis=1)
+        correct = rng.binomial(answered, SIMULATED_RECALL[:boxes])
+        for box in range(1, boxes):
+            state[:, promoted[box], min(day + intervals[promoted[box]], days)] += correct[:, box]
+        state[:, 1, min(day + intervals[1], days)] += (answered - correct).sum(axis=1)
+    return reviews
+
+
+def simulated_forecast(user, days: int = DEFAULT_DAYS, runs: int = DEFAULT_RUNS,
+                       today: Optional[date] = None) -> Dict:
+    """
+    Projected reviews per day, answering every card when due: the mean and
+    10th/90th percentile over ``runs`` simulations. Overdue and never
+    reviewed cards count as due today. Cached per user and library version.
+    """
+    today = today or datetime.utcnow().date()
+    key = f"{user.id}:{user.library_version or 0}:{today.isoformat()}:{days}:{runs}"
+    cached, _ = forecast_cache.get(key)
+    if cached is not None:
+        return cached
+
+    pending = np.zeros((MAX_BOX + 1, days), dtype=np.int64)
+    for day, box, count in _due_counts(user.id, today, days, by_box=True):
+        offset = 0 if day is None or day < today else (day - today).days
+        pending[min(max(box or 1, 1), MAX_BOX), offset] += count
+    reviews = simulate(pending, runs)
+    mean = reviews.mean(axis=0)
+    low, high = np.percentile(reviews, [10, 90], axis=0)
+    result = {
+        "runs": runs,
+        "days": [
+            {
+                "date": (today + timedelta(days=i)).isoformat(),
+                "due": round(float(mean[i]), 1),
+                "p10": round(float(low[i])),
+                "p90": round(float(high[i])),
+            }
+            for i in range(days)
+        ],
+    }
+    forecast_cache.set(key, result)
+    return result
+
@@ -0,0 +1,46 @@
+import os
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 20))
+
+
+def _build_session() -> requests.Session:
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    s.headers["User-Agent"] = "BookLogger/1.0 (+https://github.com/ryanmuenker/book_logger)"
+    return s
+
+
+# One keep-alive connection pool per process for all outbound API calls
+session = _build_session()
+
+
+class HostRateLimiter:
+    """Spaces out requests so each host sees at most ``per_second`` calls, across threads."""
+
+    def __init__(self, per_second: float) -> None:
+        self.interval = 1.0 / per_second
+        self._next_slot: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def wait(self, host: str) -> None:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def get(url: str, rate_limiter: Optional[HostRateLimiter] = None, **kwargs) -> requests.Response:
+    if rate_limiter is not None:
+        rate_limiter.wait(urlsplit(url).netloc)
+    return session.get(url, **kwargs)
@@ -1,5 +1,58 @@
-import requests
-from typing import Dict, Optional, List
+import os
+import threading
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, List
+
+from services import http
+from services.cache import FRESH, STALE, SQLiteCache
+
+OPENLIBRARY_URL = os.environ.get("OPENLIBRARY_URL", "https://openlibrary.org").rstrip("/")
+
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", 6 * 3600))
+SEARCH_CACHE_STALE = float(os.environ.get("SEARCH_CACHE_STALE", 7 * 24 * 3600))
+SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get("SEARCH_CACHE_MAX_ENTRIES", 20000))
+
+search_cache = SQLiteCache(
+    "search",
+    ttl_seconds=SEARCH_CACHE_TTL,
+    stale_seconds=SEARCH_CACHE_STALE,
+    max_entries=SEARCH_CACHE_MAX_ENTRIES,
+)
+_revalidating: set = set()
+_revalidating_lock = threading.Lock()
+
+
+def _normalize_isbn(isbn: Optional[str]) -> str:
+    return (isbn or "").replace("-", "").strip()
+
+
+def to_isbn13(isbn: Optional[str]) -> Optional[str]:
+    """
+    Canonical ISBN-13 for an ISBN-10 or ISBN-13 in any common spelling
+    (hyphens, spaces, lowercase ``x``), or None if the checksum is invalid.
+    """
+    digits = "".join((isbn or "").split()).replace("-", "").upper()
+    if len(digits) == 10 and digits[:9].isdigit() and (digits[9].isdigit() or digits[9] == "X"):
+        total = sum((10 - i) * int(d) for i, d in enumerate(digits[:9]))
+        total += 10 if digits[9] == "X" else int(digits[9])
+        if total % 11:
+            return None
+        digits = "978" + digits[:9]
+        return digits + str(-sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits)) % 10)
+    if len(digits) == 13 and digits.isdigit():
+        if sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits)) % 10:
+            return None
+        return digits
+    return None
+
+
+@lru_cache(maxsize=4096)
+def _author_name(key: str, timeout_seconds: float) -> Optional[str]:
+    """Resolve an Open Library author key; failures raise so they are not cached."""
+    resp = http.get(f"{OPENLIBRARY_URL}{key}.json", timeout=timeout_seconds)
+    if resp.status_code != 200:
+        raise LookupError(f"author lookup failed with status {resp.status_code}")
+    return resp.json().get("name") or None
 
 
 def fetch_isbn_metadata(isbn: str, timeout_seconds: float = 5.0) -> Optional[Dict[str, str]]:
@@ -10,14 +63,14 @@ def fetch_isbn_metadata(isbn: str, timeout_seconds: float = 5.0) -> Optional[Dic
     """
     if not isbn:
         return None
-    normalized = isbn.replace("-", "").strip()
+    normalized = _normalize_isbn(isbn)
     if not normalized:
         return None
 
     # Open Library API: https://openlibrary.org/isbn/{ISBN}.json
-    url = f"https://openlibrary.org/isbn/{normalized}.json"
+    url = f"{OPENLIBRARY_URL}/isbn/{normalized}.json"
     try:
-        resp = requests.get(url, timeout=timeout_seconds)
+        resp = http.get(url, timeout=timeout_seconds)
         if resp.status_code != 200:
             return None
         data = resp.json()
@@ -34,10 +87,7 @@ def fetch_isbn_metadata(isbn: str, timeout_seconds: float = 5.0) -> Optional[Dic
         key = first.get("key") if isinstance(first, dict) else None
         if key:
             try:
-                a_resp = requests.get(f"https://openlibrary.org{key}.json", timeout=timeout_seconds)
-                if a_resp.status_code == 200:
-                    a_data = a_resp.json()
-                    author = a_data.get("name") or None
+                author = _author_name(key, timeout_seconds)
             except Exception:
                 pass
 
@@ -49,26 +99,112 @@ def fetch_isbn_metadata(isbn: str, timeout_seconds: float = 5.0) -> Optional[Dic
     return result or None
 
 
+def fetch_isbn_metadata_batch(
+    isbns: Iterable[str], timeout_seconds: float = 10.0, chunk_size: int = 50
+) -> Dict[str, Dict[str, str]]:
+    """
+    Resolve many ISBNs with Open Library's ``/api/books?bibkeys=`` endpoint,
+    ``chunk_size`` ISBNs per request. Author names come back inline, so no
+    per-author round trips are needed.
+
+    Returns a dict mapping each resolved (hyphen-stripped) ISBN to a dict with
+    possible keys: title, author. ISBNs that fail or are unknown are omitted.
+    """
+    normalized = list(dict.fromkeys(n for n in (_normalize_isbn(i) for i in isbns) if n))
+    results: Dict[str, Dict[str, str]] = {}
+    for start in range(0, len(normalized), chunk_size):
+        chunk = normalized[start:start + chunk_size]
+        try:
+            resp = http.get(
+                f"{OPENLIBRARY_URL}/api/books",
+                params={"bibkeys": ",".join(f"ISBN:{i}" for i in chunk), "format": "json", "jscmd": "data"},
+                timeout=timeout_seconds,
+            )
+            if resp.status_code != 200:
+                continue
+            data = resp.json() or {}
+        except Exception:
+            continue
+        for isbn in chunk:
+            item = data.get(f"ISBN:{isbn}")
+            if not isinstance(item, dict):
+                continue
+            meta: Dict[str, str] = {}
+            if item.get("title"):
+                meta["title"] = item["title"]
+            authors = item.get("authors") or []
+            if isinstance(authors, list) and authors and isinstance(authors[0], dict):
+                if authors[0].get("name"):
+                    meta["author"] = authors[0]["name"]
+            if meta:
+                results[isbn] = meta
+    return results
+
+
+def _search_cache_key(query: str, limit: int) -> str:
+    # Case and whitespace differences should share one entry
+    return f"{limit}:{' '.join(query.casefold().split())}"
+
+
+def _revalidate(key: str, query: str, limit: int, timeout_seconds: float) -> None:
+    try:
+        results = _search_openlibrary(query, limit, timeout_seconds)
+        if results is not None:
+            search_cache.set(key, results)
+    finally:
+        with _revalidating_lock:
+            _revalidating.discard(key)
+
+
+def _revalidate_in_background(key: str, query: str, limit: int, timeout_seconds: float) -> None:
+    with _revalidating_lock:
+        if key in _revalidating:
+            return
+        _revalidating.add(key)
+    threading.Thread(
+        target=_revalidate, args=(key, query, limit, timeout_seconds), daemon=True
+    ).start()
+
+
 def search_books(query: str, limit: int = 10, timeout_seconds: float = 5.0) -> List[Dict[str, str]]:
     """
     Search Open Library for books. Returns a list of dicts with
     keys: title, author, isbn (preferred ISBN13 when available).
+
+    Results are cached in the shared search cache; stale entries are served
+    immediately while a background refresh runs.
     """
     q = (query or "").strip()
     if not q:
         return []
+    key = _search_cache_key(q, limit)
+    cached, state = search_cache.get(key)
+    if state == FRESH:
+        return cached
+    if state == STALE:
+        _revalidate_in_background(key, q, limit, timeout_seconds)
+        return cached
+    results = _search_openlibrary(q, limit, timeout_seconds)
+    if results is None:
+        return []
+    search_cache.set(key, results)
+    return results
+
+
+def _search_openlibrary(q: str, limit: int, timeout_seconds: float) -> Optional[List[Dict[str, str]]]:
+    """Query Open Library search; returns None when the request fails."""
     try:
-        resp = requests.get(
-            "https://openlibrary.org/search.json",
+        resp = http.get(
+            f"{OPENLIBRARY_URL}/search.json",
             params={"q": q, "limit": limit},
             timeout=timeout_seconds,
         )
         if resp.status_code != 200:
-            return []
+            return None
         data = resp.json() or {}
         docs = data.get("docs") or []
     except Exception:
-        return []
+        return None
 
     results: List[Dict[str, str]] = []
     for d in docs:
@@ -84,5 +220,3 @@ def search_books(query: str, limit: int = 10, timeout_seconds: float = 5.0) -> L
         cover_id = d.get('cover_i')
         results.append({"title": title, "author": author, "isbn": isbn, "cover_id": cover_id})
     return results
-
-
@@ -0,0 +1,75 @@
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+
+from models import db, Job
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+# A running job that has not reported progress for this long is assumed dead
+JOB_STALE_AFTER = timedelta(minutes=10)
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+
+
+def submit(app, job_id: int, fn: Callable[..., None], *args: Any) -> Optional[Future]:
+    """
+    Run ``fn(job_id, *args)`` on the background job pool inside an app context.
+
+    The job is marked failed if ``fn`` raises. With ``JOBS_RUN_INLINE`` set in
+    the app config the job runs synchronously (used by the tests).
+    """
+    def run() -> None:
+        with app.app_context():
+            try:
+                fn(job_id, *args)
+            except Exception as exc:
+                db.session.rollback()
+                job = db.session.get(Job, job_id)
+                if job is not None:
+                    job.status = 'failed'
+                    job.error = str(exc)[:2000]
+                    job.finished_at = datetime.utcnow()
+                    db.session.commit()
+            finally:
+                db.session.remove()
+
+    if app.config.get("JOBS_RUN_INLINE"):
+        run()
+        return None
+    return _executor.submit(run)
+
+
+def is_active(job: Job) -> bool:
+    if job.status not in ('queued', 'running'):
+        return False
+    return job.updated_at is None or job.updated_at > datetime.utcnow() - JOB_STALE_AFTER
+
+
+def expire_if_stale(job: Job) -> bool:
+    """Mark a queued or running job whose worker stopped reporting as failed
+    (``interrupted``), so it can be resumed. Returns whether it was stale."""
+    if job.status not in ('queued', 'running') or is_active(job):
+        return False
+    job.status = 'failed'
+    job.error = 'interrupted'
+    job.finished_at = datetime.utcnow()
+    return True
+
+
+def serialize(job: Job) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "total": job.total,
+        "processed": job.processed,
+        "succeeded": job.succeeded,
+        "skipped": job.skipped,
+        "failed": job.failed,
+        "last_id": job.last_id,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
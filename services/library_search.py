@@ -0,0 +1,165 @@
+import re
+from itertools import chain
+from typing import Iterable, List, Set, Tuple
+
+from sqlalchemy import bindparam, event, text
+from sqlalchemy.orm import Session
+
+from models import db, Book, UserBook
+
+# One document per UserBook: the book's title and author plus the user's tags
+# and notes (falling back to the book's), as /api/books.json shows them.
+# SQLite uses an FTS5 table keyed by user_book.id; the owner column holds a
+# "u<user_id>" token so the per-user filter is part of the index lookup.
+# PostgreSQL uses a weighted tsvector table with a GIN index.
+SQLITE_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS library_fts USING fts5("
+    "owner, title, author, tags, notes, tokenize='porter unicode61 remove_diacritics 2')",
+)
+POSTGRES_DDL = (
+    "CREATE TABLE IF NOT EXISTS library_fts ("
+    "user_book_id integer PRIMARY KEY, user_id integer NOT NULL, document tsvector NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_library_fts_user_id ON library_fts (user_id)",
+    "CREATE INDEX IF NOT EXISTS ix_library_fts_document ON library_fts USING GIN (document)",
+)
+
+_DOCUMENT_SOURCE = " FROM user_book ub JOIN book b ON b.id = ub.book_id"
+_TAGS = "coalesce(nullif(ub.tags, ''), b.tags, '')"
+_NOTES = "coalesce(nullif(ub.notes, ''), b.notes, '')"
+SQLITE_INSERT = (
+    "INSERT INTO library_fts (rowid, owner, title, author, tags, notes)"
+    f" SELECT ub.id, 'u' || ub.user_id, b.title, b.author, {_TAGS}, {_NOTES}" + _DOCUMENT_SOURCE
+)
+POSTGRES_INSERT = (
+    "INSERT INTO library_fts (user_book_id, user_id, document)"
+    " SELECT ub.id, ub.user_id,"
+    " setweight(to_tsvector('english', b.title), 'A') ||"
+    " setweight(to_tsvector('english', b.author), 'B') ||"
+    f" setweight(to_tsvector('english', {_TAGS}), 'C') ||"
+    f" setweight(to_tsvector('english', {_NOTES}), 'D')" + _DOCUMENT_SOURCE
+)
+REFRESH_CHUNK_SIZE = 500
+
+
+def _dialect(connection):
+    name = connection.dialect.name
+    return name if name in ('sqlite', 'postgresql') else None
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_index(target, connection, **kw):
+    dialect = _dialect(connection)
+    if dialect is None:
+        return
+    for statement in SQLITE_DDL if dialect == 'sqlite' else POSTGRES_DDL:
+        connection.exec_driver_sql(statement)
+    # Databases that predate the index are populated once
+    indexed = connection.execute(text("SELECT 1 FROM library_fts LIMIT 1")).first()
+    if indexed is None:
+        connection.execute(text(SQLITE_INSERT if dialect == 'sqlite' else POSTGRES_INSERT))
+
+
+@event.listens_for(db.metadata, 'before_drop')
+def _drop_index(target, connection, **kw):
+    if _dialect(connection) is not None:
+        connection.exec_driver_sql("DROP TABLE IF EXISTS library_fts")
+
+
+def refresh(connection, link_ids: Iterable[int]) -> None:
+    """Rewrite the documents of these UserBook ids (removing deleted ones)."""
+    dialect = _dialect(connection)
+    if dialect is None:
+        return
+    key = 'rowid' if dialect == 'sqlite' else 'user_book_id'
+    insert = SQLITE_INSERT if dialect == 'sqlite' else POSTGRES_INSERT
+    delete_stmt = text(f"DELETE FROM library_fts WHERE {key} IN :ids").bindparams(bindparam('ids', expanding=True))
+    insert_stmt = text(insert + " WHERE ub.id IN :ids").bindparams(bindparam('ids', expanding=True))
+    ids = sorted(link_ids)
+    for start in range(0, len(ids), REFRESH_CHUNK_SIZE):
+        chunk = ids[start:start + REFRESH_CHUNK_SIZE]
+        connection.execute(delete_stmt, {'ids': chunk})
+        connection.execute(insert_stmt, {'ids': chunk})
+
+
+def link_ids_for_books(connection, book_ids: Iterable[int]) -> Set[int]:
+    book_ids = sorted(book_ids)
+    link_ids = set()
+    for start in range(0, len(book_ids), REFRESH_CHUNK_SIZE):
+        rows = connection.execute(
+            db.select(UserBook.id).where(UserBook.book_id.in_(book_ids[start:start + REFRESH_CHUNK_SIZE]))
+        )
+        link_ids.update(link_id for (link_id,) in rows)
+    return link_ids
+
+
+def refresh_books(connection, book_ids: Iterable[int]) -> None:
+    """Refresh every library document of these books, e.g. after a bulk UPDATE of ``book``."""
+    refresh(connection, link_ids_for_books(connection, book_ids))
+
+
+def flushed_link_ids(session, flush_context) -> Set[int]:
+    """UserBook ids whose library entry a flush added, changed or removed,
+    including the links of changed books. For after_flush hooks: computed
+    once per flush and shared by every hook that asks."""
+    cached = flush_context.attributes.get('flushed_link_ids')
+    if cached is not None:
+        return cached
+    link_ids = set()
+    book_ids = set()
+    modified = [obj for obj in session.dirty if session.is_modified(obj)]
+    # New books have no links yet; their new UserBooks are picked up here
+    link_ids.update(obj.id for obj in session.new if isinstance(obj, UserBook))
+    for obj in chain(modified, session.deleted):
+        if isinstance(obj, UserBook):
+            link_ids.add(obj.id)
+        elif isinstance(obj, Book):
+            book_ids.add(obj.id)
+    if book_ids:
+        link_ids |= link_ids_for_books(session.connection(), book_ids)
+    flush_context.attributes['flushed_link_ids'] = link_ids
+    return link_ids
+
+
+@event.listens_for(Session, 'after_flush')
+def _sync_flushed(session, flush_context):
+    """Keep the index in step with ORM writes, in the same transaction."""
+    link_ids = flushed_link_ids(session, flush_context)
+    if link_ids:
+        refresh(session.connection(), link_ids)
+
+
+def _match_terms(q: str) -> List[str]:
+    return re.findall(r'\w+', q.lower())
+
+
+def search(user_id: int, q: str, limit: int, offset: int = 0) -> Tuple[List[int], bool]:
+    """
+    Ranked full-text search of one user's library. Every word must match
+    (as a prefix). Returns ``(user_book_ids, has_more)``, best match first.
+    """
+    terms = _match_terms(q)
+    connection = db.session.connection()
+    dialect = _dialect(connection)
+    if not terms or dialect is None:
+        return [], False
+    if dialect == 'sqlite':
+        match = f'owner : u{int(user_id)} AND {{title author tags notes}} : (' + ' AND '.join(
+            f'"{t}"*' for t in terms
+        ) + ')'
+        stmt = text(
+            "SELECT rowid FROM library_fts WHERE library_fts MATCH :match"
+            " ORDER BY bm25(library_fts, 0.0, 10.0, 5.0, 2.0, 1.0), rowid DESC"
+            " LIMIT :limit OFFSET :offset"
+        )
+        params = {'match': match, 'limit': limit + 1, 'offset': offset}
+    else:
+        stmt = text(
+            "SELECT user_book_id FROM library_fts, to_tsquery('english', :query) query"
+            " WHERE user_id = :user_id AND document @@ query"
+            " ORDER BY ts_rank(document, query) DESC, user_book_id DESC"
+            " LIMIT :limit OFFSET :offset"
+        )
+        params = {'query': ' & '.join(f'{t}:*' for t in terms), 'user_id': user_id,
+                  'limit': limit + 1, 'offset': offset}
+    ids = [link_id for (link_id,) in connection.execute(stmt, params)]
+    return ids[:limit], len(ids) > limit
@@ -0,0 +1,155 @@
+import atexit
+import os
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import case, func, insert
+
+from models import db, Book, ReviewLog
+
+REVIEW_LOG_BATCH_SIZE = int(os.environ.get("REVIEW_LOG_BATCH_SIZE", 500))
+REVIEW_LOG_FLUSH_SECONDS = float(os.environ.get("REVIEW_LOG_FLUSH_SECONDS", 2))
+DEFAULT_RETENTION_DAYS = 90
+MAX_RETENTION_DAYS = 3650
+
+
+class ReviewLogBuffer:
+    """
+    Answers waiting to be appended to ``review_log``. The answer path only
+    appends to a list; rows are written with one executemany once
+    ``batch_size`` are waiting or ``flush_seconds`` after the first one, so
+    a crash loses at most that window. A failed write puts the rows back
+    for the next flush. Each process has its own buffer, so readers only see
+    rows this process has buffered once they are flushed here; other
+    processes' rows show up after their own flush.
+    """
+
+    def __init__(self, batch_size: int = REVIEW_LOG_BATCH_SIZE,
+                 flush_seconds: float = REVIEW_LOG_FLUSH_SECONDS) -> None:
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._rows: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._app = None
+
+    def add(self, app, rows: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._app = app
+            self._rows.extend(rows)
+            full = len(self._rows) >= self.batch_size
+            # Tests run background work inline, so nothing is left to a timer
+            if not full and self._timer is None and not app.config.get("JOBS_RUN_INLINE"):
+                self._timer = threading.Timer(self.flush_seconds, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def flush(self) -> int:
+        """Write every waiting row now. Returns how many were written (0 if
+        the write failed and the rows were put back)."""
+        with self._lock:
+            rows, self._rows = self._rows, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            app = self._app
+        if not rows:
+            return 0
+        with app.app_context():
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(insert(ReviewLog), rows)
+            except Exception:
+                # Keep the rows for the next flush rather than dropping them;
+                # a timer thread would only print the error
+                app.logger.exception("Writing %d review_log rows failed; keeping them buffered", len(rows))
+                self._requeue(app, rows)
+                return 0
+        return len(rows)
+
+    def _requeue(self, app, rows: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._rows[:0] = rows
+            if self._timer is None and not app.config.get("JOBS_RUN_INLINE"):
+                self._timer = threading.Timer(self.flush_seconds, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._rows = []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+
+buffer = ReviewLogBuffer()
+atexit.register(buffer.flush)
+
+
+def log_row(user_id: int, entry_id: int, book_id: int, srs_box: int, correct: bool,
+            reviewed_at: datetime, interval_days: Optional[float],
+            last_reviewed_at: Optional[datetime], algorithm: str) -> Dict[str, Any]:
+    """A review_log row from a card's state before the answer."""
+    elapsed = (reviewed_at - last_reviewed_at).total_seconds() / 86400 if last_reviewed_at else None
+    return {
+        'user_id': user_id,
+        'vocab_entry_id': entry_id,
+        'book_id': book_id,
+        'srs_box': srs_box or 1,
+        'correct': bool(correct),
+        'reviewed_at': reviewed_at,
+        'scheduled_days': interval_days,
+        'elapsed_days': elapsed,
+        'algorithm': algorithm,
+    }
+
+
+def _window(user_id: int, days: int):
+    since = datetime.combine(datetime.utcnow().date() - timedelta(days=days - 1), datetime.min.time())
+    return [ReviewLog.user_id == user_id, ReviewLog.reviewed_at >= since]
+
+
+def _counts(group, user_id: int, days: int):
+    """``(group, reviews, correct)`` rows: one aggregate over the index
+    that starts with ``(user_id, group)``."""
+    return (
+        db.session.query(group, func.count(), func.sum(case((ReviewLog.correct, 1), else_=0)))
+        .filter(*_window(user_id, days))
+        .group_by(group)
+        .order_by(group)
+        .all()
+    )
+
+
+def _rate(reviews: int, correct: int) -> Dict[str, Any]:
+    correct = int(correct or 0)
+    return {"reviews": reviews, "correct": correct, "retention": round(correct / reviews, 4) if reviews else None}
+
+
+def retention_by_box(user_id: int, days: int = DEFAULT_RETENTION_DAYS) -> List[Dict[str, Any]]:
+    return [{"srs_box": box, **_rate(n, correct)} for box, n, correct in _counts(ReviewLog.srs_box, user_id, days)]
+
+
+def retention_by_book(user_id: int, days: int = DEFAULT_RETENTION_DAYS) -> List[Dict[str, Any]]:
+    rows = _counts(ReviewLog.book_id, user_id, days)
+    titles = dict(
+        db.session.query(Book.id, Book.title).filter(Book.id.in_([book_id for book_id, _, _ in rows]))
+    ) if rows else {}
+    return [
+        {"book_id": book_id, "title": titles.get(book_id), **_rate(n, correct)}
+        for book_id, n, correct in rows
+    ]
+
+
+def retention_by_day(user_id: int, days: int = DEFAULT_RETENTION_DAYS) -> List[Dict[str, Any]]:
+    """Daily retention (UTC days with at least one review), oldest first."""
+    rows = _counts(func.date(ReviewLog.reviewed_at), user_id, days)
+    # SQLite returns the date as text, PostgreSQL as a date
+    return [
+        {"date": date.fromisoformat(str(day)).isoformat(), **_rate(n, correct)}
+        for day, n, correct in rows
+    ]
@@ -0,0 +1,370 @@
+import os
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import String, bindparam, func, or_, type_coerce
+
+from models import db, User, VocabEntry
+from services import versions
+
+# Per-card state, as columns of VocabEntry. Schedulers work on whole decks at
+# once: a "state" is a dict of equally long NumPy arrays, one per column,
+# with NaN (numbers) or NaT (datetimes) where the column is NULL.
+STATE_COLUMNS = (
+    'srs_box', 'interval_days', 'repetitions', 'lapses', 'ease', 'stability', 'difficulty',
+    'last_reviewed_at', 'next_review_at',
+)
+_INTEGER_COLUMNS = ('srs_box', 'repetitions', 'lapses')
+_DATETIME_COLUMNS = ('last_reviewed_at', 'next_review_at')
+
+DEFAULT_ALGORITHM = os.environ.get("SRS_ALGORITHM", "leitner")
+FSRS_DESIRED_RETENTION = float(os.environ.get("FSRS_DESIRED_RETENTION", 0.9))
+RESCHEDULE_CHUNK_SIZE = int(os.environ.get("RESCHEDULE_CHUNK_SIZE", 100000))
+
+MAX_BOX = 5
+LEITNER_INTERVALS = np.array([1, 1, 2, 5, 10, 20], dtype=float)  # days, by box (index 0 unused)
+MAX_INTERVAL_DAYS = 36500
+_SECONDS_PER_DAY = 86400
+
+
+def _days(values: np.ndarray) -> np.ndarray:
+    """Float days as a timedelta64 array (NaN counts as zero)."""
+    return np.round(np.nan_to_num(values) * _SECONDS_PER_DAY).astype(np.int64).astype('timedelta64[s]')
+
+
+def _leitner_interval(boxes: np.ndarray) -> np.ndarray:
+    return LEITNER_INTERVALS[np.clip(np.nan_to_num(boxes, nan=1), 1, MAX_BOX).astype(np.int64)]
+
+
+def states_from_rows(rows: Sequence[Sequence]) -> Dict[str, np.ndarray]:
+    """Build a state from rows holding the STATE_COLUMNS in order."""
+    columns = list(zip(*rows)) if rows else [()] * len(STATE_COLUMNS)
+    return {
+        name: np.array(values, dtype='datetime64[s]' if name in _DATETIME_COLUMNS else float)
+        for name, values in zip(STATE_COLUMNS, columns)
+    }
+
+
+def rows_from_state(state: Dict[str, np.ndarray], sqlite_text: bool = False) -> Dict[str, list]:
+    """
+    Column name -> list of Python values (None for NULL), ready to write.
+    With ``sqlite_text`` datetimes are formatted the way SQLAlchemy stores
+    them in SQLite, for writes that bypass its type processing.
+    """
+    columns = {}
+    for name in STATE_COLUMNS:
+        values = state[name]
+        if name in _DATETIME_COLUMNS:
+            values = values.astype('datetime64[us]')
+            if sqlite_text:
+                column = np.char.replace(np.datetime_as_string(values, unit='us'), 'T', ' ').astype(object)
+                column[np.isnat(values)] = None
+                columns[name] = column.tolist()
+            else:
+                columns[name] = values.astype(object).tolist()
+            continue
+        missing = np.isnan(values)
+        if name in _INTEGER_COLUMNS:
+            column = np.where(missing, 0, values).astype(np.int64).astype(object)
+        else:
+            column = values.astype(object)
+        column[missing] = None
+        columns[name] = column.tolist()
+    return columns
+
+
+def take(state: Dict[str, np.ndarray], index) -> Dict[str, np.ndarray]:
+    return {name: values[index] for name, values in state.items()}
+
+
+def changed(old: Dict[str, np.ndarray], new: Dict[str, np.ndarray],
+            columns: Tuple[str, ...] = STATE_COLUMNS) -> np.ndarray:
+    """Mask of the cards whose ``columns`` differ (NULLs compare equal)."""
+    mask = np.zeros(len(old[STATE_COLUMNS[0]]), dtype=bool)
+    for name in columns:
+        missing = np.isnat if name in _DATETIME_COLUMNS else np.isnan
+        mask |= (old[name] != new[name]) & ~(missing(old[name]) & missing(new[name]))
+    return mask
+
+
+def put(state: Dict[str, np.ndarray], index, values: Dict[str, np.ndarray]) -> None:
+    for name in STATE_COLUMNS:
+        state[name][index] = values[name]
+
+
+class Scheduler:
+    """
+    A spaced-repetition algorithm. ``review`` applies one answer to each card
+    of a state; ``reschedule`` recomputes the due dates of already reviewed
+    cards from their state, after the algorithm or its parameters changed.
+    Both return a new state.
+
+    Subclasses set ``name`` and implement ``_interval`` (days until the next
+    review) and, if they keep their own state, ``_fill`` and ``_update``.
+    """
+
+    name = None
+
+    def review(self, state: Dict[str, np.ndarray], correct: np.ndarray, now: np.ndarray) -> Dict[str, np.ndarray]:
+        correct = np.asarray(correct, dtype=bool)
+        now = np.asarray(now, dtype='datetime64[s]')
+        previous = self._fill(_fill_history(state))
+        elapsed = np.where(
+            np.isnat(previous['last_reviewed_at']), 0,
+            (now - previous['last_reviewed_at']) / np.timedelta64(1, 'D'),
+        )
+        new = self._update(previous, correct, np.maximum(elapsed, 0))
+        new['srs_box'] = np.where(correct, np.minimum(MAX_BOX, previous['srs_box'] + 1), 1)
+        new['repetitions'] = np.where(correct, previous['repetitions'] + 1, 0)
+        new['lapses'] = previous['lapses'] + ~correct
+        new['interval_days'] = self._interval(new)
+        new['last_reviewed_at'] = now.copy()
+        new['next_review_at'] = now + _days(new['interval_days'])
+        return new
+
+    def reschedule(self, state: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        new = self._fill(_fill_history(state))
+        reviewed = ~np.isnat(new['last_reviewed_at'])
+        new['interval_days'] = np.where(reviewed, self._interval(new), np.nan)
+        new['next_review_at'] = np.where(
+            reviewed, new['last_reviewed_at'] + _days(new['interval_days']), new['next_review_at'],
+        )
+        return new
+
+    def _fill(self, state: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        return state
+
+    def _update(self, state: Dict[str, np.ndarray], correct: np.ndarray, elapsed: np.ndarray) -> Dict[str, np.ndarray]:
+        return dict(state)
+
+    def _interval(self, state: Dict[str, np.ndarray]) -> np.ndarray:
+        raise NotImplementedError
+
+
+def _fill_history(state: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    Copy of ``state`` with the common columns of cards scheduled before
+    these columns existed derived from their Leitner box and due date.
+    """
+    state = {name: values.copy() for name, values in state.items()}
+    box = np.clip(np.nan_to_num(state['srs_box'], nan=1), 1, MAX_BOX)
+    legacy = np.isnat(state['last_reviewed_at']) & ~np.isnat(state['next_review_at'])
+    state['last_reviewed_at'][legacy] = state['next_review_at'][legacy] - _days(_leitner_interval(box[legacy]))
+    reviewed = ~np.isnat(state['last_reviewed_at'])
+    state['srs_box'] = box
+    state['interval_days'] = np.where(
+        np.isnan(state['interval_days']) & reviewed, _leitner_interval(box), state['interval_days'],
+    )
+    state['repetitions'] = np.where(
+        np.isnan(state['repetitions']), np.where(reviewed, box - 1, 0), state['repetitions'],
+    )
+    state['lapses'] = np.nan_to_num(state['lapses'])
+    return state
+
+
+class Leitner(Scheduler):
+    """Five boxes with fixed intervals; a miss sends the card back to box 1."""
+
+    name = 'leitner'
+
+    def _interval(self, state):
+        return _leitner_interval(state['srs_box'])
+
+
+class SM2(Scheduler):
+    """SuperMemo 2: intervals of 1, 6, then the previous interval times the
+    card's ease factor, which moves with the answer quality."""
+
+    name = 'sm2'
+    initial_ease = 2.5
+    min_ease = 1.3
+    # Answers are only right or wrong; grade them on SM-2's 0..5 scale
+    correct_quality = 5
+    incorrect_quality = 2
+
+    def _fill(self, state):
+        state['ease'] = np.where(np.isnan(state['ease']), self.initial_ease, state['ease'])
+        return state
+
+    def _update(self, state, correct, elapsed):
+        new = dict(state)
+        quality = np.where(correct, self.correct_quality, self.incorrect_quality)
+        interval = np.where(
+            state['repetitions'] == 0, 1,
+            np.where(state['repetitions'] == 1, 6, np.round(state['interval_days'] * state['ease'])),
+        )
+        new['interval_days'] = np.where(correct, interval, 1)
+        new['ease'] = np.maximum(
+            self.min_ease, state['ease'] + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02),
+        )
+        return new
+
+    def _interval(self, state):
+        return np.clip(state['interval_days'], 1, MAX_INTERVAL_DAYS)
+
+
+class FSRS(Scheduler):
+    """
+    FSRS-style scheduling: each card has a memory stability (days until
+    recall probability falls to 90%) and a difficulty. The next review is
+    when the predicted recall probability reaches ``desired_retention``.
+    Uses the FSRS-4.5 forgetting curve and default weights.
+    """
+
+    name = 'fsrs'
+    weights = (
+        0.4872, 1.4003, 3.7145, 13.8206, 5.1618, 1.2298, 0.8975, 0.031, 1.6474,
+        0.1367, 1.0461, 2.1072, 0.0793, 0.3246, 1.587, 0.2272, 2.8755,
+    )
+    decay = -0.5
+    factor = 19 / 81
+    # Answers are only right or wrong: "Good" (3) or "Again" (1)
+    correct_grade = 3
+    incorrect_grade = 1
+
+    def __init__(self, desired_retention: float = FSRS_DESIRED_RETENTION) -> None:
+        self.desired_retention = desired_retention
+
+    def _initial_difficulty(self, grade):
+        w = self.weights
+        return np.clip(w[4] - (grade - 3) * w[5], 1, 10)
+
+    def _fill(self, state):
+        # Cards reviewed under another algorithm: their current interval was
+        # (roughly) the time until recall dropped to 90%
+        reviewed = ~np.isnat(state['last_reviewed_at'])
+        state['stability'] = np.where(
+            np.isnan(state['stability']) & reviewed, np.maximum(state['interval_days'], 1), state['stability'],
+        )
+        state['difficulty'] = np.where(
+            np.isnan(state['difficulty']) & reviewed, self._initial_difficulty(self.correct_grade), state['difficulty'],
+        )
+        return state
+
+    def _update(self, state, correct, elapsed):
+        w = self.weights
+        new = dict(state)
+        grade = np.where(correct, self.correct_grade, self.incorrect_grade)
+        first = np.isnan(state['stability'])
+        # First reviews start from the grade's initial values; NaN elsewhere is discarded below
+        with np.errstate(invalid='ignore', divide='ignore'):
+            stability, difficulty = state['stability'], state['difficulty']
+            recall = (1 + self.factor * elapsed / stability) ** self.decay
+            recalled = stability * (
+                1 + np.exp(w[8]) * (11 - difficulty) * stability ** -w[9] * (np.exp(w[10] * (1 - recall)) - 1)
+            )
+            forgotten = (
+                w[11] * difficulty ** -w[12] * ((stability + 1) ** w[13] - 1) * np.exp(w[14] * (1 - recall))
+            )
+            next_difficulty = difficulty - w[6] * (grade - 3)
+            next_difficulty = w[7] * self._initial_difficulty(3) + (1 - w[7]) * next_difficulty
+        new['stability'] = np.where(
+            first, np.where(correct, w[2], w[0]), np.where(correct, recalled, np.minimum(forgotten, stability)),
+        )
+        new['difficulty'] = np.where(first, self._initial_difficulty(grade), np.clip(next_difficulty, 1, 10))
+        return new
+
+    def _interval(self, state):
+        interval = state['stability'] / self.factor * (self.desired_retention ** (1 / self.decay) - 1)
+        return np.clip(np.round(interval), 1, MAX_INTERVAL_DAYS)
+
+
+SCHEDULERS = {scheduler.name: scheduler for scheduler in (Leitner(), SM2(), FSRS())}
+
+
+def get_scheduler(name: Optional[str] = None) -> Scheduler:
+    """The scheduler called ``name`` (a user's ``srs_algorithm``), else the default."""
+    return SCHEDULERS.get(name or DEFAULT_ALGORITHM) or SCHEDULERS['leitner']
+
+
+def load_state(entries: Iterable[VocabEntry]) -> Dict[str, np.ndarray]:
+    return states_from_rows([tuple(getattr(e, name) for name in STATE_COLUMNS) for e in entries])
+
+
+def apply_state(entries: List[VocabEntry], state: Dict[str, np.ndarray]) -> None:
+    """Copy a state back onto the ORM entries it was loaded from."""
+    for name, values in rows_from_state(state).items():
+        for entry, value in zip(entries, values):
+            setattr(entry, name, value)
+
+
+def review_entry(entry: VocabEntry, correct: bool, answered_at, scheduler: Scheduler) -> None:
+    """Apply one answer to an ORM entry (the flush hook stamps the version)."""
+    state = scheduler.review(load_state([entry]), np.array([correct]), np.array([answered_at], dtype='datetime64[s]'))
+    apply_state([entry], state)
+
+
+def reschedule(connection, user_id: Optional[int] = None, chunk_size: int = RESCHEDULE_CHUNK_SIZE) -> int:
+    """
+    Recompute the due dates of every reviewed card of ``user_id`` (or of
+    every user), each with its owner's algorithm, after the algorithm or its
+    parameters changed. Cards are read and written ``chunk_size`` at a time
+    and scheduled as NumPy arrays; only cards whose due date moved are
+    written, with one driver-level executemany per chunk. Bumps the library
+    versions of those cards' owners and stamps the rows (call inside the
+    writing transaction), so sync clients only fetch what changed. Returns
+    the number of cards whose schedule changed.
+    """
+    entries = VocabEntry.__table__
+    users = User.__table__
+    criteria = [or_(entries.c.next_review_at.is_not(None), entries.c.last_reviewed_at.is_not(None))]
+    owners = db.select(users.c.id, users.c.srs_algorithm)
+    if user_id is not None:
+        criteria.append(entries.c.user_id == user_id)
+        owners = owners.where(users.c.id == user_id)
+    else:
+        owners = owners.where(users.c.id.in_(db.select(entries.c.user_id).distinct()))
+    algorithms = dict(connection.execute(owners).all())
+    new_versions: Dict[int, int] = {}
+
+    sqlite = connection.dialect.name == 'sqlite'
+    # Read SQLite's datetime text as is: NumPy parses it much faster than datetime objects
+    select = (
+        db.select(entries.c.id, entries.c.user_id, *(
+            type_coerce(entries.c[name], String) if sqlite and name in _DATETIME_COLUMNS else entries.c[name]
+            for name in STATE_COLUMNS
+        ))
+        .where(*criteria)
+        .order_by(entries.c.id)
+        .limit(chunk_size)
+    )
+    write = (
+        entries.update()
+        .where(entries.c.id == bindparam('b_id'))
+        .values({
+            **{name: bindparam(f'b_{name}') for name in STATE_COLUMNS + ('version',)},
+            'updated_at': func.now(),
+        })
+        .compile(dialect=connection.dialect)
+    )
+    count = 0
+    last_id = 0
+    while True:
+        rows = connection.execute(select.where(entries.c.id > last_id)).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        ids, owner_ids = np.array([row[0] for row in rows]), np.array([row[1] for row in rows])
+        state = states_from_rows([row[2:] for row in rows])
+        new = {name: values.copy() for name, values in state.items()}
+        owner_list, owner_index = np.unique(owner_ids, return_inverse=True)
+        owner_algorithms = np.array([get_scheduler(algorithms.get(int(u))).name for u in owner_list])[owner_index]
+        for name in np.unique(owner_algorithms):
+            mask = owner_algorithms == name
+            put(new, mask, SCHEDULERS[name].reschedule(take(state, mask)))
+        # Backfilled history columns alone are not a new schedule
+        mask = changed(state, new, ('next_review_at',))
+        if not mask.any():
+            continue
+        owners_changed = [int(u) for u in np.unique(owner_ids[mask])]
+        new_versions.update(versions.bump(connection, [u for u in owners_changed if u not in new_versions]))
+        params = {f'b_{name}': values for name, values in rows_from_state(take(new, mask), sqlite).items()}
+        params['b_version'] = [new_versions[int(u)] for u in owner_ids[mask]]
+        params['b_id'] = ids[mask].tolist()
+        if write.positional:
+            values = list(zip(*(params[key] for key in write.positiontup)))
+        else:
+            values = [dict(zip(params, row)) for row in zip(*params.values())]
+        connection.exec_driver_sql(write.string, values)
+        count += int(mask.sum())
+    return count
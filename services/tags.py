@@ -0,0 +1,84 @@
+from typing import Iterable, List, Set
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from models import db, Book, UserBook, UserBookTag
+from services.library_search import REFRESH_CHUNK_SIZE, flushed_link_ids, link_ids_for_books
+
+_tags = UserBookTag.__table__
+
+
+def split_tags(tags: str) -> Set[str]:
+    return {t.strip()[:200] for t in (tags or '').split(',') if t.strip()}
+
+
+def refresh(connection, link_ids: Iterable[int]) -> None:
+    """Rewrite the tag rows of these UserBook ids (removing deleted ones)."""
+    ids = sorted(link_ids)
+    for start in range(0, len(ids), REFRESH_CHUNK_SIZE):
+        chunk = ids[start:start + REFRESH_CHUNK_SIZE]
+        connection.execute(_tags.delete().where(_tags.c.user_book_id.in_(chunk)))
+        rows = connection.execute(
+            db.select(UserBook.id, UserBook.user_id, UserBook.tags, Book.tags)
+            .join(Book, Book.id == UserBook.book_id)
+            .where(UserBook.id.in_(chunk))
+        )
+        values = [
+            {'user_book_id': link_id, 'user_id': user_id, 'tag': tag}
+            for link_id, user_id, link_tags, book_tags in rows
+            # Same fallback as the library payload: the entry's tags, else the book's
+            for tag in split_tags(link_tags or book_tags)
+        ]
+        if values:
+            connection.execute(_tags.insert(), values)
+
+
+def refresh_books(connection, book_ids: Iterable[int]) -> None:
+    """Refresh the tags of every library entry of these books, e.g. after a bulk UPDATE of ``book``."""
+    refresh(connection, link_ids_for_books(connection, book_ids))
+
+
+@event.listens_for(Session, 'after_flush')
+def _sync_flushed(session, flush_context):
+    link_ids = flushed_link_ids(session, flush_context)
+    if link_ids:
+        refresh(session.connection(), link_ids)
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _populate(target, connection, **kw):
+    # Databases that predate the tag table are indexed once
+    if connection.execute(db.select(_tags.c.user_book_id).limit(1)).first() is not None:
+        return
+    last_id = 0
+    while True:
+        ids = connection.execute(
+            db.select(UserBook.id).where(UserBook.id > last_id).order_by(UserBook.id).limit(REFRESH_CHUNK_SIZE)
+        ).scalars().all()
+        if not ids:
+            return
+        refresh(connection, ids)
+        last_id = ids[-1]
+
+
+def facet_counts(user_id: int) -> List[dict]:
+    """``[{"tag", "count"}]`` for the user's library, most used first."""
+    count = func.count()
+    rows = (
+        db.session.query(UserBookTag.tag, count)
+        .filter(UserBookTag.user_id == user_id)
+        .group_by(UserBookTag.tag)
+        .order_by(count.desc(), UserBookTag.tag)
+    )
+    return [{'tag': tag, 'count': n} for tag, n in rows]
+
+
+def all_tags(user_id: int) -> List[str]:
+    rows = (
+        db.session.query(UserBookTag.tag)
+        .filter(UserBookTag.user_id == user_id)
+        .distinct()
+        .order_by(UserBookTag.tag)
+    )
+    return [tag for (tag,) in rows]
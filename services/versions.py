@@ -0,0 +1,138 @@
+import zlib
+from functools import wraps
+from itertools import chain
+from typing import Dict, Iterable, Set
+
+from flask import make_response, request
+from flask_login import current_user
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from models import db, Book, Tombstone, User, UserBook, VocabEntry
+
+CHUNK_SIZE = 500
+
+
+def bump(connection, user_ids: Iterable[int]) -> Dict[int, int]:
+    """
+    Advance the library version of these users (call inside the writing
+    transaction). Returns ``{user_id: new_version}`` for stamping rows.
+    """
+    ids = sorted(set(user_ids))
+    users = User.__table__
+    new_versions = {}
+    for start in range(0, len(ids), CHUNK_SIZE):
+        chunk = ids[start:start + CHUNK_SIZE]
+        connection.execute(
+            users.update()
+            .where(users.c.id.in_(chunk))
+            .values(library_version=func.coalesce(users.c.library_version, 0) + 1)
+        )
+        new_versions.update(connection.execute(
+            db.select(users.c.id, users.c.library_version).where(users.c.id.in_(chunk))
+        ).all())
+    return new_versions
+
+
+def stamp_links(connection, *criteria) -> None:
+    """Stamp the UserBooks matching ``criteria`` with their owner's current
+    version, after a Core write (the flush hook stamps ORM writes)."""
+    links = UserBook.__table__
+    users = User.__table__
+    owner_version = db.select(users.c.library_version).where(users.c.id == links.c.user_id).scalar_subquery()
+    connection.execute(
+        links.update().where(*criteria).values(version=owner_version, updated_at=func.now())
+    )
+
+
+def users_of_books(connection, book_ids: Iterable[int]) -> Set[int]:
+    """Users whose library or vocabulary includes any of these books."""
+    book_ids = sorted(set(book_ids))
+    user_ids = set()
+    for start in range(0, len(book_ids), CHUNK_SIZE):
+        chunk = book_ids[start:start + CHUNK_SIZE]
+        for model in (UserBook, VocabEntry):
+            rows = connection.execute(
+                db.select(model.user_id).where(model.book_id.in_(chunk)).distinct()
+            )
+            user_ids.update(user_id for (user_id,) in rows)
+    return user_ids
+
+
+def bump_for_books(connection, book_ids: Iterable[int]) -> None:
+    """Bump everyone who sees these books and restamp their library entries,
+    e.g. after a bulk UPDATE of ``book``."""
+    bump(connection, users_of_books(connection, book_ids))
+    _stamp_books(connection, book_ids)
+
+
+def _stamp_books(connection, book_ids: Iterable[int]) -> None:
+    book_ids = sorted(set(book_ids))
+    for start in range(0, len(book_ids), CHUNK_SIZE):
+        stamp_links(connection, UserBook.__table__.c.book_id.in_(book_ids[start:start + CHUNK_SIZE]))
+
+
+@event.listens_for(Session, 'before_flush')
+def _stamp_flushed(session, flush_context, instances):
+    """
+    Bump the versions of users whose library or vocabulary is being written,
+    stamp the written rows with the new version and record deletions as
+    tombstones, all in the flushing transaction.
+    """
+    rows = []
+    deleted = []
+    book_ids = set()
+    modified = [obj for obj in session.dirty if session.is_modified(obj)]
+    for obj in chain(session.new, modified, session.deleted):
+        if isinstance(obj, (UserBook, VocabEntry)):
+            (deleted if obj in session.deleted else rows).append(obj)
+        elif isinstance(obj, Book) and obj not in session.new:
+            book_ids.add(obj.id)
+    if not rows and not deleted and not book_ids:
+        return
+    connection = session.connection()
+    user_ids = {obj.user_id for obj in chain(rows, deleted)} | users_of_books(connection, book_ids)
+    new_versions = bump(connection, user_ids)
+    for obj in rows:
+        obj.version = new_versions[obj.user_id]
+    for obj in deleted:
+        session.add(Tombstone(
+            user_id=obj.user_id,
+            kind='user_book' if isinstance(obj, UserBook) else 'vocab_entry',
+            row_id=obj.id,
+            book_id=obj.book_id,
+            version=new_versions[obj.user_id],
+        ))
+    if book_ids:
+        _stamp_books(connection, book_ids)
+
+
+def library_etag(user) -> str:
+    # The representation also depends on the path and query string (paging, format)
+    variant = zlib.crc32(request.full_path.encode('utf-8'))
+    return f"{user.id}-{user.library_version or 0}-{variant:08x}"
+
+
+def conditional_on_library_version(view):
+    """
+    Tag the view's response with a strong ETag derived from the user's library
+    version and answer a matching ``If-None-Match`` with 304 before the view
+    runs. The version comes from the already loaded ``current_user``, so a
+    repeat request costs no extra query.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not current_user.is_authenticated:
+            return view(*args, **kwargs)
+        etag = library_etag(current_user)
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        # Let browsers keep the copy but revalidate it on every use
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return wrapper
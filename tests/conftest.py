@@ -1,10 +1,12 @@
 import os
 import sys
+import tempfile
 from pathlib import Path
 
 import pytest
 
 os.environ.setdefault("DATABASE_URL", "sqlite:///test_app.sqlite3")
+os.environ.setdefault("CACHE_DB_PATH", os.path.join(tempfile.mkdtemp(), "cache.sqlite3"))
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 if str(PROJECT_ROOT) not in sys.path:
@@ -12,6 +14,7 @@ if str(PROJECT_ROOT) not in sys.path:
 
 from app import app as flask_app  # noqa: E402
 from models import db  # noqa: E402
+from services import isbn, review_log  # noqa: E402
 
 TEST_TEMPLATES = Path(__file__).parent / "templates"
 if flask_app.jinja_loader and str(TEST_TEMPLATES) not in flask_app.jinja_loader.searchpath:
@@ -26,6 +29,7 @@ def app(tmp_path_factory):
             "TESTING": True,
             "SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path}",
             "WTF_CSRF_ENABLED": False,
+            "JOBS_RUN_INLINE": True,
         }
     )
     with flask_app.app_context():
@@ -41,6 +45,14 @@ def _clean_database(app):
         db.session.remove()
 
 
+@pytest.fixture(autouse=True)
+def _clear_caches():
+    isbn.search_cache.clear()
+    isbn._author_name.cache_clear()
+    review_log.buffer.clear()
+    yield
+
+
 @pytest.fixture
 def client(app):
     return app.test_client()
@@ -1,6 +1,6 @@
 from unittest.mock import MagicMock
 
-from models import Book, UserBook, db
+from models import Book, User, UserBook, book_key, db, ensure_schema
 
 
 def create_book(app, **kwargs):
@@ -153,6 +153,114 @@ def test_add_to_library_requires_title_and_author(auth_client):
     assert resp.get_json()["error"]
 
 
+def test_find_or_create_matches_normalized_key(auth_client, app):
+    assert book_key("The  Hobbit!", "J.R.R. Tolkien") == book_key("the hobbit", "JRR TOLKIEN")
+    book_id = create_book(app, title="The Hobbit", author="J.R.R. Tolkien")
+
+    resp = auth_client.post("/api/add_to_library", json={"title": "the hobbit", "author": "JRR Tolkien"})
+    assert resp.get_json()["book_id"] == book_id
+    auth_client.post("/books/new", data={"title": "THE HOBBIT.", "author": "j. r. r. tolkien"})
+    with app.app_context():
+        assert Book.query.count() == 2  # "j r r" keeps its spaces: a different key
+        assert UserBook.query.filter_by(book_id=book_id).count() == 1
+
+
+def test_ensure_schema_backfills_book_keys(app):
+    with app.app_context():
+        book = Book.__table__
+        db.session.execute(book.insert(), [
+            {"title": "Dune", "author": "Frank Herbert"},
+            {"title": "dune", "author": "FRANK HERBERT"},
+        ])
+        db.session.execute(book.update().values(dedupe_key=None))
+        db.session.commit()
+
+        ensure_schema()
+        keys = [k for (k,) in db.session.query(Book.dedupe_key).order_by(Book.id)]
+        assert keys == [book_key("Dune", "Frank Herbert"), None]
+
+
+def test_add_to_library_matches_equivalent_isbns(auth_client, app):
+    book_id = create_book(app, title="Sample", author="Author", isbn="0-306-40615-2")
+    resp = auth_client.post("/api/add_to_library", json={"isbn": "978 0306 40615 7"})
+    assert resp.get_json()["book_id"] == book_id
+
+    with app.app_context():
+        db.session.execute(Book.__table__.update().values(isbn13=None))
+        db.session.commit()
+        ensure_schema()
+        assert Book.query.get(book_id).isbn13 == "9780306406157"
+
+
+def test_add_to_library_is_idempotent(auth_client, app):
+    payload = {"title": "Deep Work", "author": "Cal Newport"}
+    first = auth_client.post("/api/add_to_library", json=payload).get_json()
+    second = auth_client.post("/api/add_to_library", json=payload).get_json()
+    assert first["book_id"] == second["book_id"]
+    with app.app_context():
+        assert Book.query.one().dedupe_key == book_key("Deep Work", "Cal Newport")
+        assert UserBook.query.count() == 1
+
+
+def test_ensure_schema_dedupes_links_before_unique_index(app):
+    book_id = create_book(app)
+    with app.app_context():
+        db.session.execute(db.text("DROP INDEX ix_user_book_user_id_book_id"))
+        db.session.execute(UserBook.__table__.insert(), [
+            {"user_id": 1, "book_id": book_id, "status": "reading"},
+            {"user_id": 1, "book_id": book_id, "status": "wishlist"},
+        ])
+        db.session.commit()
+
+        ensure_schema()
+        assert [link.status for link in UserBook.query.all()] == ["reading"]
+
+
+def test_migration_indexes_tags_of_deduped_links_only(auth_client, app):
+    book_id = create_book(app)
+    with app.app_context():
+        user_id = User.query.filter_by(email="tester@example.com").one().id
+        # A database from before the unique link index and the tag table
+        db.session.execute(db.text("DROP INDEX ix_user_book_user_id_book_id"))
+        db.session.execute(db.text("DROP TABLE user_book_tag"))
+        db.session.execute(UserBook.__table__.insert(), [
+            {"user_id": user_id, "book_id": book_id, "status": "reading", "tags": "fantasy"},
+            {"user_id": user_id, "book_id": book_id, "status": "wishlist", "tags": "sf, classic"},
+        ])
+        db.session.commit()
+
+        # Same order as app startup
+        ensure_schema()
+        db.create_all()
+
+    assert auth_client.get("/api/library/tags").get_json()["tags"] == [{"tag": "fantasy", "count": 1}]
+    assert auth_client.get("/api/library/tags/sf").get_json()["items"] == []
+
+
+def test_migration_indexes_search_documents_of_deduped_links_only(auth_client, app):
+    book_id = create_book(app, title="Neuromancer", author="William Gibson")
+    with app.app_context():
+        user_id = User.query.filter_by(email="tester@example.com").one().id
+        # A database from before the unique link index and the search index
+        db.session.execute(db.text("DROP INDEX ix_user_book_user_id_book_id"))
+        db.session.execute(db.text("DROP TABLE library_fts"))
+        db.session.execute(UserBook.__table__.insert(), [
+            {"user_id": user_id, "book_id": book_id, "status": "reading"},
+            {"user_id": user_id, "book_id": book_id, "status": "wishlist"},
+        ])
+        db.session.commit()
+
+        # Same order as app startup
+        ensure_schema()
+        db.create_all()
+        kept = [link.id for link in UserBook.query.all()]
+        indexed = db.session.execute(db.text("SELECT rowid FROM library_fts")).scalars().all()
+        assert len(kept) == 1 and indexed == kept
+
+    items = auth_client.get("/api/library/search?q=neuromancer").get_json()["items"]
+    assert [i["status"] for i in items] == ["reading"]
+
+
 def test_api_search_uses_service(monkeypatch, client):
     fake_results = [{"title": "Book", "author": "Author", "isbn": "123"}]
     mocked = MagicMock(return_value=fake_results)
@@ -164,3 +272,241 @@ def test_api_search_uses_service(monkeypatch, client):
     mocked.assert_called_once_with("test", limit=10)
 
 
+def test_library_keyset_pagination(auth_client, app):
+    for i in range(5):
+        auth_client.post("/api/add_to_library", json={"title": f"Paged {i}", "author": "Pager"})
+
+    # Unpaginated form is unchanged
+    full = auth_client.get("/api/books.json").get_json()
+    assert isinstance(full, list) and len(full) == 5
+
+    first = auth_client.get("/api/books.json?limit=2").get_json()
+    assert [b["title"] for b in first["items"]] == ["Paged 4", "Paged 3"]
+    assert first["next_cursor"] is not None
+
+    seen = [b["title"] for b in first["items"]]
+    cursor = first["next_cursor"]
+    while cursor is not None:
+        page = auth_client.get(f"/api/my.json?limit=2&cursor={cursor}").get_json()
+        seen.extend(entry["book"]["title"] for entry in page["items"])
+        cursor = page["next_cursor"]
+    assert seen == [f"Paged {i}" for i in range(4, -1, -1)]
+
+    books_page = auth_client.get("/books?limit=3").get_json()
+    assert len(books_page["books"]) == 3
+    assert books_page["next_cursor"] is not None
+
+
+def test_streamed_exports(client, app, monkeypatch):
+    import gzip
+    import json
+
+    monkeypatch.setattr("routes.books.EXPORT_CHUNK_SIZE", 2)
+    for i in range(5):
+        create_book(app, title=f"Stream {i}", author="Streamer, Jr.")
+
+    data = client.get("/export.json").get_json()
+    assert [b["title"] for b in data] == [f"Stream {i}" for i in range(5)]
+
+    ndjson = client.get("/export.ndjson").get_data(as_text=True)
+    lines = [json.loads(line) for line in ndjson.splitlines()]
+    assert len(lines) == 5 and lines[0]["author"] == "Streamer, Jr."
+
+    csv_text = client.get("/export.csv").get_data(as_text=True)
+    assert csv_text.splitlines()[1].startswith('1,Stream 0,"Streamer, Jr."')
+
+    gz_resp = client.get("/export.csv?gzip=1")
+    assert gz_resp.mimetype == "application/gzip"
+    assert gzip.decompress(gz_resp.get_data()).decode("utf-8") == csv_text
+
+
+def test_backfill_covers_runs_as_batched_job(auth_client, app, monkeypatch):
+    monkeypatch.setattr("services.covers.BACKFILL_BATCH_SIZE", 2)
+    covers = {"Found": 11, "Also Found": 22}
+
+    def fake_lookup(title, author):
+        if title == "Broken":
+            raise RuntimeError("timeout")
+        return covers.get(title)
+
+    monkeypatch.setattr("services.covers.lookup_cover_id", fake_lookup)
+    found = create_book(app, title="Found")
+    create_book(app, title="Has Isbn", isbn="9780000000000")
+    create_book(app, title="Broken")
+    create_book(app, title="Unknown")
+    also_found = create_book(app, title="Also Found")
+
+    resp = auth_client.post("/api/backfill_covers")
+    assert resp.status_code == 202
+    job = resp.get_json()["job"]
+    assert job["status"] == "completed"
+    assert (job["total"], job["succeeded"], job["skipped"], job["failed"]) == (4, 2, 1, 1)
+    assert job["last_id"] == also_found
+
+    status = auth_client.get(f"/api/backfill_covers/{job['id']}").get_json()["job"]
+    assert status["processed"] == 4
+    with app.app_context():
+        assert Book.query.get(found).cover_id == 11
+        assert Book.query.get(also_found).cover_id == 22
+
+
+def test_backfill_covers_resumes_after_last_processed_id(auth_client, app, monkeypatch):
+    from models import Job
+
+    seen = []
+    monkeypatch.setattr("services.covers.lookup_cover_id", lambda title, author: seen.append(title))
+    first = create_book(app, title="Done Before")
+    create_book(app, title="Still To Do")
+    with app.app_context():
+        db.session.add(Job(kind="backfill_covers", status="failed", last_id=first))
+        db.session.commit()
+
+    job = auth_client.post("/api/backfill_covers").get_json()["job"]
+    assert job["total"] == 1
+    assert seen == ["Still To Do"]
+
+
+def test_concurrent_backfill_starts_queue_one_job(app, monkeypatch):
+    from models import Job
+    from services import covers
+
+    needs_cover = covers._needs_cover
+
+    def racing_needs_cover():
+        # Another request queues its backfill between our active-job check and insert
+        with db.engine.begin() as connection:
+            connection.execute(Job.__table__.insert(), {"kind": "backfill_covers", "status": "queued"})
+        monkeypatch.setattr(covers, "_needs_cover", needs_cover)
+        return needs_cover()
+
+    monkeypatch.setattr(covers, "_needs_cover", racing_needs_cover)
+    with app.app_context():
+        job, created = covers.start_backfill(None)
+        assert not created
+        assert Job.query.filter_by(kind="backfill_covers").count() == 1
+        assert job.status == "queued"
+
+
+def test_library_search_ranks_pages_and_stays_in_sync(auth_client, app):
+    auth_client.post("/api/add_to_library", json={"title": "Dune", "author": "Frank Herbert"})
+    auth_client.post("/api/add_to_library", json={"title": "Children of Dune", "author": "Frank Herbert"})
+    auth_client.post("/api/add_to_library", json={"title": "Neuromancer", "author": "William Gibson"})
+    messiah_id = create_book(app, title="Dune Messiah", author="Frank Herbert")
+    with app.app_context():
+        other = User(email="other@example.com")
+        other.set_password("pw")
+        db.session.add(other)
+        db.session.flush()
+        db.session.add(UserBook(user_id=other.id, book_id=messiah_id))
+        db.session.commit()
+
+    data = auth_client.get("/api/library/search?q=dune&limit=1").get_json()
+    assert [item["title"] for item in data["items"]] == ["Dune"]
+    data = auth_client.get(f"/api/library/search?q=dune&limit=1&cursor={data['next_cursor']}").get_json()
+    assert [item["title"] for item in data["items"]] == ["Children of Dune"]
+    assert data["next_cursor"] is None
+
+    neuromancer = auth_client.get("/api/library/search?q=gibs").get_json()["items"][0]
+    auth_client.post(f"/books/{neuromancer['id']}/edit", data={
+        "title": "Neuromancer", "author": "William Gibson", "tags": "cyberpunk", "notes": "Sprawl trilogy",
+    })
+    assert [i["title"] for i in auth_client.get("/api/library/search?q=sprawl cyber").get_json()["items"]] == ["Neuromancer"]
+
+    auth_client.post(f"/books/{neuromancer['id']}/delete")
+    assert auth_client.get("/api/library/search?q=neuromancer").get_json() == {"items": [], "next_cursor": None}
+
+
+def test_tag_facets_and_tag_filtered_pages(auth_client, app):
+    with app.app_context():
+        user = User.query.filter_by(email="tester@example.com").first()
+        books = [Book(title=f"Book {i}", author="Author", tags="classic") for i in range(3)]
+        db.session.add_all(books)
+        db.session.flush()
+        db.session.add_all([
+            UserBook(user_id=user.id, book_id=books[0].id, tags="sci-fi, favourite"),
+            UserBook(user_id=user.id, book_id=books[1].id, tags="sci-fi"),
+            UserBook(user_id=user.id, book_id=books[2].id),  # falls back to the book's tags
+        ])
+        db.session.commit()
+
+    facets = auth_client.get("/api/library/tags").get_json()["tags"]
+    assert facets == [
+        {"tag": "sci-fi", "count": 2}, {"tag": "classic", "count": 1}, {"tag": "favourite", "count": 1},
+    ]
+    listing = auth_client.get("/books").get_json()
+    assert listing["all_tags"] == ["classic", "favourite", "sci-fi"]
+    assert {b["title"]: b["tags"] for b in listing["books"]} == {
+        "Book 0": "sci-fi, favourite", "Book 1": "sci-fi", "Book 2": "classic",
+    }
+
+    page = auth_client.get("/api/library/tags/sci-fi?limit=1").get_json()
+    assert [i["title"] for i in page["items"]] == ["Book 1"]
+    page = auth_client.get(f"/api/library/tags/sci-fi?limit=1&cursor={page['next_cursor']}").get_json()
+    assert [i["title"] for i in page["items"]] == ["Book 0"]
+    assert page["next_cursor"] is None
+
+    auth_client.post(f"/books/{page['items'][0]['id']}/edit", data={"title": "Book 0", "author": "Author", "tags": "reread"})
+    facets = {f["tag"]: f["count"] for f in auth_client.get("/api/library/tags").get_json()["tags"]}
+    assert facets == {"sci-fi": 1, "classic": 1, "reread": 1}
+
+
+def test_flush_hooks_share_flushed_link_ids(auth_client, app, monkeypatch):
+    from services import library_search
+
+    calls = []
+    link_ids_for_books = library_search.link_ids_for_books
+
+    def counting(connection, book_ids):
+        calls.append(set(book_ids))
+        return link_ids_for_books(connection, book_ids)
+
+    with app.app_context():
+        user = User.query.filter_by(email="tester@example.com").first()
+        book = Book(title="Dune", author="Frank Herbert", tags="classic")
+        db.session.add(book)
+        db.session.flush()
+        db.session.add(UserBook(user_id=user.id, book_id=book.id))
+        db.session.commit()
+
+        monkeypatch.setattr(library_search, "link_ids_for_books", counting)
+        book.tags = "sci-fi"
+        db.session.commit()
+        # One lookup per flush, used by both the search index and the tag table
+        assert calls == [{book.id}]
+
+    assert auth_client.get("/books").get_json()["all_tags"] == ["sci-fi"]
+    assert auth_client.get("/api/library/search?q=sci").get_json()["items"][0]["title"] == "Dune"
+
+
+def test_library_etag_answers_304_until_library_changes(auth_client, app):
+    auth_client.post("/api/add_to_library", json={"title": "Dune", "author": "Frank Herbert"})
+    first = auth_client.get("/api/books.json")
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and not first.headers["ETag"].startswith("W/")
+
+    again = auth_client.get("/api/books.json", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.data == b""
+    assert auth_client.get("/api/books.json?limit=1", headers={"If-None-Match": etag}).status_code == 200
+
+    book_id = first.get_json()[0]["id"]
+    auth_client.post("/vocab/api", json={"book_id": book_id, "word": "spice"})
+    changed = auth_client.get("/api/books.json", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
+
+    vocab_etag = auth_client.get("/vocab/review/books").headers["ETag"]
+    assert auth_client.get("/vocab/review/books", headers={"If-None-Match": vocab_etag}).status_code == 304
+
+
+def test_books_batch_matches_book_detail(auth_client, app):
+    owned = auth_client.post("/api/add_to_library", json={"title": "Dune", "author": "Frank Herbert"}).get_json()["book_id"]
+    other = create_book(app, title="Emma", author="Jane Austen")
+
+    data = auth_client.get(f"/api/books/batch?ids={other},{owned},999,{other}").get_json()
+    assert data["books"] == [auth_client.get(f"/books/{i}").get_json() for i in (other, owned)]
+    assert data["books"][1]["user_data"]["status"] == "wishlist"
+    assert data["not_found"] == [999]
+
+    assert auth_client.get("/books/999").status_code == 404
+    assert auth_client.get("/api/books/batch?ids=1,x").status_code == 400
+    too_many = ",".join(str(i) for i in range(1, 102))
+    assert auth_client.get(f"/api/books/batch?ids={too_many}").status_code == 400
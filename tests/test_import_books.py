@@ -44,3 +44,155 @@ def test_import_goodreads_creates_user_books(auth_client, app):
         assert UserBook.query.count() == 2
 
 
+def test_import_goodreads_resolves_rows_in_chunks(auth_client, app, monkeypatch):
+    from routes import import_books as import_routes
+
+    monkeypatch.setattr("routes.import_books.LOOKUP_CHUNK_SIZE", 50)
+    chunk_sizes = []
+    real_chunks = import_routes._chunks
+
+    def recording_chunks(values, size=None):
+        for chunk in real_chunks(values, size):
+            chunk_sizes.append(len(chunk))
+            yield chunk
+
+    monkeypatch.setattr("routes.import_books._chunks", recording_chunks)
+    with app.app_context():
+        owned = Book(title="Owned", author="Writer", isbn="0-306-40615-2")
+        shared = Book(title="Shared", author="Writer")
+        db.session.add_all([owned, shared])
+        db.session.commit()
+        user = User.query.filter_by(email="tester@example.com").first()
+        db.session.add(UserBook(user_id=user.id, book_id=owned.id))
+        db.session.commit()
+
+    rows = [{"title": f"Bulk {i}", "author": "Writer", "isbn": f"isbn-{i}"} for i in range(120)]
+    rows += [
+        {"title": "Renamed Owned", "author": "Writer", "isbn": "9780306406157"},  # matched by ISBN-13
+        {"title": "Shared", "author": "Writer", "isbn": ""},  # existing book, new link
+        {"title": "Bulk 3", "author": "Writer", "isbn": "isbn-3"},  # repeated in payload
+        {"title": "", "author": "Nobody", "isbn": ""},
+    ]
+
+    preview = auth_client.post("/api/import/goodreads/preview", json={"books": rows}).get_json()
+    assert preview["duplicates"] == 1
+    assert preview["new"] == 122
+    # 122 distinct title/author keys are looked up 50 at a time
+    assert max(chunk_sizes) == 50 and chunk_sizes.count(50) >= 2
+
+    data = auth_client.post("/api/import/goodreads", json={"books": rows}).get_json()
+    assert data == {"imported": 121, "skipped": 3}
+    with app.app_context():
+        assert Book.query.count() == 122
+        assert UserBook.query.count() == 122
+
+
+def test_import_job_processes_chunks_and_reports_errors(auth_client, app, monkeypatch):
+    monkeypatch.setattr("routes.import_books.IMPORT_JOB_CHUNK_SIZE", 2)
+    rows = sample_books() + [
+        {"title": "Dune", "author": "Frank Herbert", "isbn": "456"},
+        {"title": "No Author", "author": ""},
+        {"title": "Neuromancer", "author": "William Gibson"},
+    ]
+
+    resp = auth_client.post("/api/import/goodreads/jobs", json={"books": rows})
+    assert resp.status_code == 202
+    job_id = resp.get_json()["job"]["id"]
+
+    status = auth_client.get(f"/api/import/jobs/{job_id}").get_json()
+    job = status["job"]
+    assert job["status"] == "completed"
+    assert (job["total"], job["processed"]) == (5, 5)
+    assert (job["succeeded"], job["skipped"], job["failed"]) == (3, 1, 1)
+    assert status["errors"] == [{"row": 4, "error": "title and author are required"}]
+    with app.app_context():
+        assert UserBook.query.count() == 3
+
+
+def test_import_job_isolates_failing_rows(auth_client, app, monkeypatch):
+    from routes import import_books
+
+    real_import_rows = import_books._import_rows
+
+    def flaky_import_rows(books, user_id):
+        if any(b["title"] == "Bad Row" for b in books):
+            raise ValueError("boom")
+        return real_import_rows(books, user_id)
+
+    monkeypatch.setattr("routes.import_books._import_rows", flaky_import_rows)
+    rows = [{"title": "Bad Row", "author": "X"}] + sample_books()
+    job_id = auth_client.post("/api/import/goodreads/jobs", json={"books": rows}).get_json()["job"]["id"]
+
+    status = auth_client.get(f"/api/import/jobs/{job_id}").get_json()
+    assert status["job"]["succeeded"] == 2
+    assert status["errors"] == [{"row": 1, "error": "boom"}]
+
+
+def test_interrupted_import_job_is_reported_and_resumes_after_last_id(auth_client, app, monkeypatch):
+    from datetime import datetime, timedelta
+
+    from models import ImportJobRow, Job
+
+    monkeypatch.setattr("routes.import_books.IMPORT_JOB_CHUNK_SIZE", 1)
+    # The worker never picks the job up, as if the process died after the first chunk
+    monkeypatch.setattr("routes.import_books.jobs.submit", lambda *args: None)
+    job_id = auth_client.post("/api/import/goodreads/jobs", json={"books": sample_books()}).get_json()["job"]["id"]
+    monkeypatch.undo()
+    with app.app_context():
+        job = db.session.get(Job, job_id)
+        ImportJobRow.query.filter_by(job_id=job_id, row_number=1).delete()
+        job.status, job.processed, job.last_id = "running", 1, 1
+        job.updated_at = datetime.utcnow() - timedelta(hours=1)
+        db.session.commit()
+
+    status = auth_client.get(f"/api/import/jobs/{job_id}").get_json()
+    assert (status["job"]["status"], status["job"]["error"], status["resumable"]) == ("failed", "interrupted", True)
+
+    resp = auth_client.post(f"/api/import/jobs/{job_id}/resume")
+    assert resp.status_code == 202
+    status = auth_client.get(f"/api/import/jobs/{job_id}").get_json()
+    assert (status["job"]["status"], status["job"]["processed"], status["resumable"]) == ("completed", 2, False)
+    with app.app_context():
+        # Only the rows after last_id were imported by the resumed run
+        assert [b.title for b in Book.query.all()] == [sample_books()[1]["title"]]
+    assert auth_client.post(f"/api/import/jobs/{job_id}/resume").status_code == 409
+
+
+GOODREADS_CSV = (
+    "Book Id,Title,Author,ISBN,ISBN13,My Rating,Average Rating,Date Read,Date Added,Bookshelves,My Review\n"
+    '1,Dune,Frank Herbert,"=""0441013597""","=""9780441013593""",5,4.25,2020/01/02,2019/12/01,read,"Spice, sand"\n'
+    "2,Neuromancer,William Gibson,,,0,3.9,,2021/03/04,to-read,\n"
+    "3,Dune,Frank Herbert,,,4,4.25,,,read,\n"
+)
+
+
+def test_upload_goodreads_csv_streams_in_chunks(auth_client, app, monkeypatch):
+    import io
+
+    monkeypatch.setattr("routes.import_books.UPLOAD_CHUNK_SIZE", 1)
+    resp = auth_client.post(
+        "/api/import/goodreads/upload",
+        data={"file": (io.BytesIO(GOODREADS_CSV.encode("utf-8")), "goodreads.csv")},
+        content_type="multipart/form-data",
+    )
+    assert resp.status_code == 200
+    assert resp.get_json() == {"imported": 2, "skipped": 1}
+
+    with app.app_context():
+        dune = Book.query.filter_by(title="Dune").first()
+        assert dune.isbn == "0441013597"
+        link = UserBook.query.filter_by(book_id=dune.id).first()
+        assert (link.rating, link.status, link.notes) == (5, "completed", "Spice, sand")
+
+
+def test_upload_goodreads_raw_csv_body_as_background_job(auth_client, app):
+    resp = auth_client.post(
+        "/api/import/goodreads/upload?background=1",
+        data=GOODREADS_CSV.encode("utf-8"),
+        content_type="text/csv",
+    )
+    assert resp.status_code == 202
+    job = resp.get_json()["job"]
+    assert (job["status"], job["total"], job["succeeded"], job["skipped"]) == ("completed", 3, 2, 1)
+
+    assert auth_client.post("/api/import/goodreads/upload", json={}).status_code == 400
@@ -0,0 +1,186 @@
+import gzip
+import json
+import os
+
+import import_books as cli
+from models import Book, db
+
+
+def test_iter_json_books_streams_small_reads(tmp_path, monkeypatch):
+    monkeypatch.setattr(cli, "JSON_READ_SIZE", 7)
+    books = [{"title": f"Title {i}", "author": "Author", "rating": 10 + i} for i in range(20)]
+    path = tmp_path / "books.json.gz"
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump({"meta": {"source": "test", "n": [1, 2]}, "books": books}, f)
+
+    records = list(cli.iter_json_books(str(path)))
+    assert [r["title"] for r in records] == [b["title"] for b in books]
+    assert records[-1]["rating"] == 29
+    assert cli.infer_format_from_path(str(path)) == "json"
+
+
+def test_streaming_import_dedupes_per_batch(app, tmp_path):
+    with app.app_context():
+        db.session.add(Book(title="Existing", author="Writer", notes="old"))
+        db.session.commit()
+
+    path = tmp_path / "books.ndjson"
+    rows = [
+        {"title": "existing", "author": "WRITER", "notes": "new"},
+        {"title": "Fresh", "author": "Writer"},
+        {"title": "Fresh", "author": "Writer"},
+        {"title": "", "author": "Nobody"},
+        {"title": "Another", "author": "Writer"},
+    ]
+    path.write_text("\n".join(json.dumps(r) for r in rows) + "\n", encoding="utf-8")
+
+    with app.app_context():
+        result = cli.import_books(
+            str(path), "auto", batch_size=2, update_existing=True,
+            enrich_by_isbn=False, stream=True,
+        )
+        assert result == (2, 2, 1)
+        assert Book.query.count() == 3
+        assert Book.query.filter_by(title="Existing").one().notes == "new"
+
+
+def test_fast_import_upserts_through_core(app, tmp_path):
+    with app.app_context():
+        db.session.add(Book(title="Existing", author="Writer", rating=1))
+        db.session.commit()
+
+    path = tmp_path / "books.csv"
+    path.write_text(
+        "title,author,rating,tags\n"
+        "Existing,Writer,5,updated\n"
+        "Fresh,Writer,4,\n"
+        "fresh,writer,3,\n"
+        ",Nobody,,\n"
+        "Another,Writer,,\n",
+        encoding="utf-8",
+    )
+    with app.app_context():
+        result = cli.import_books(
+            str(path), "auto", batch_size=2, update_existing=True,
+            enrich_by_isbn=False, fast=True,
+        )
+        assert result == (2, 2, 1)
+        assert Book.query.count() == 3
+        existing = Book.query.filter_by(title="Existing").one()
+        assert (existing.rating, existing.tags) == (5, "updated")
+        assert Book.query.filter_by(title="Fresh").one().rating == 3
+
+
+def test_enrichment_runs_ahead_in_order_and_caches(app, tmp_path, monkeypatch):
+    import threading
+
+    from services.cache import SQLiteCache
+
+    calls = []
+    batches = []
+    lock = threading.Lock()
+
+    def fake_fetch(isbn):
+        with lock:
+            calls.append(isbn)
+        return {"title": f"Title {isbn}", "author": "Looked Up"} if isbn != "000" else None
+
+    def fake_fetch_batch(isbns, chunk_size):
+        with lock:
+            batches.append(list(isbns))
+        # The bibkeys endpoint misses some ISBNs that the per-ISBN lookup knows
+        return {i: {"title": f"Title {i}", "author": "Looked Up"} for i in isbns if i not in {"000", "002"}}
+
+    monkeypatch.setattr(cli, "ISBN_BATCH_SIZE", 10)
+    monkeypatch.setattr(cli, "fetch_isbn_metadata", fake_fetch)
+    monkeypatch.setattr(cli, "fetch_isbn_metadata_batch", fake_fetch_batch)
+    cache = SQLiteCache("isbn_metadata", path=str(tmp_path / "isbn.sqlite3"))
+    records = [
+        {"title": "", "author": "", "isbn": f"{i:03d}"} for i in range(1, 30)
+    ] + [
+        {"title": "Known", "author": "Writer", "isbn": "999"},
+        {"title": "", "author": "", "isbn": "001"},
+        {"title": "", "author": "", "isbn": "000"},
+    ]
+
+    out = list(cli.enrich_records(records, concurrency=3, cache=cache))
+    assert [r["title"] for r in out[:3]] == ["Title 001", "Title 002", "Title 003"]
+    assert out[29]["title"] == "Known"
+    assert out[30]["title"] == "Title 001"
+    assert out[31]["title"] == ""
+    assert sorted(i for batch in batches for i in batch) == sorted({r["isbn"] for r in records if r["isbn"] != "999"})
+    assert max(len(batch) for batch in batches) == 10
+    assert sorted(calls) == ["000", "002"]  # per-ISBN fallback for batch misses only
+
+    calls.clear()
+    batches.clear()
+    list(cli.enrich_records(records, concurrency=3, cache=cache))
+    assert batches == [["000"]] and calls == ["000"]  # only the unresolved ISBN is looked up again
+
+
+def test_resume_continues_from_checkpoint(app, tmp_path, monkeypatch):
+    path = tmp_path / "books.csv"
+    path.write_text(
+        "title,author\n" + "".join(f"Title {i},Writer\n" for i in range(7)),
+        encoding="utf-8",
+    )
+    checkpoint = str(tmp_path / "books.checkpoint.json")
+    resolve = cli.resolve_title_author
+
+    def crash_on_title_5(rec, enrich_by_isbn):
+        if rec["title"] == "Title 5":
+            raise RuntimeError("interrupted")
+        return resolve(rec, enrich_by_isbn)
+
+    with app.app_context():
+        monkeypatch.setattr(cli, "resolve_title_author", crash_on_title_5)
+        try:
+            cli.import_books(
+                str(path), "auto", batch_size=2, update_existing=False,
+                enrich_by_isbn=False, stream=True, checkpoint_path=checkpoint,
+            )
+        except RuntimeError:
+            pass
+        with open(checkpoint, encoding="utf-8") as f:
+            state = json.load(f)
+        assert (state["rows"], state["batches"], state["created"]) == (4, 2, 4)
+        assert Book.query.count() == 4
+
+        monkeypatch.setattr(cli, "resolve_title_author", resolve)
+        result = cli.import_books(
+            str(path), "auto", batch_size=2, update_existing=False,
+            enrich_by_isbn=False, stream=True, checkpoint_path=checkpoint, resume=True,
+        )
+        assert result == (3, 0, 0)
+        assert sorted(b.title for b in Book.query.all()) == [f"Title {i}" for i in range(7)]
+    assert not (tmp_path / "books.checkpoint.json").exists()
+
+
+def test_resume_skips_compressed_input_by_record_count(app, tmp_path):
+    path = tmp_path / "books.ndjson.gz"
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for i in range(5):
+            f.write(json.dumps({"title": f"Title {i}", "author": "Writer"}) + "\n")
+    assert all("_offset" not in rec for rec in cli.read_ndjson(str(path)))
+
+    checkpoint = cli.Checkpoint(str(tmp_path / "books.checkpoint.json"), str(path))
+    checkpoint.save(3, {"title": "Title 2"}, 3, 0, 0)
+    with app.app_context():
+        result = cli.import_books(
+            str(path), "auto", batch_size=2, update_existing=False,
+            enrich_by_isbn=False, stream=True, checkpoint_path=checkpoint.path, resume=True,
+        )
+        assert result == (2, 0, 0)
+        assert sorted(b.title for b in Book.query.all()) == ["Title 3", "Title 4"]
+
+
+def test_default_checkpoint_path_falls_back_when_input_dir_is_read_only(tmp_path, monkeypatch):
+    path = str(tmp_path / "books.csv")
+    assert cli.default_checkpoint_path(path) == f"{path}.checkpoint.json"
+
+    monkeypatch.setattr(cli, "CHECKPOINT_DIR", str(tmp_path / "checkpoints"))
+    monkeypatch.setattr(cli.os, "access", lambda p, mode: False)
+    fallback = cli.default_checkpoint_path(path)
+    assert os.path.dirname(fallback) == str(tmp_path / "checkpoints")
+    assert os.path.basename(fallback).startswith("books.csv-")
+    assert os.path.isdir(tmp_path / "checkpoints")
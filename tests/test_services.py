@@ -25,7 +25,7 @@ def test_search_books_parses_success(monkeypatch):
             }
 
     mock_get = MagicMock(return_value=DummyResp())
-    monkeypatch.setattr("services.isbn.requests.get", mock_get)
+    monkeypatch.setattr("services.isbn.http.get", mock_get)
     result = isbn.search_books("book")
     assert result == [
         {
@@ -39,7 +39,7 @@ def test_search_books_parses_success(monkeypatch):
 
 def test_fetch_isbn_metadata_handles_network_errors(monkeypatch):
     mock_get = MagicMock(side_effect=Exception("network down"))
-    monkeypatch.setattr("services.isbn.requests.get", mock_get)
+    monkeypatch.setattr("services.isbn.http.get", mock_get)
     result = isbn.fetch_isbn_metadata("1234567890")
     assert result is None
     mock_get.assert_called_once()
@@ -62,8 +62,170 @@ def test_fetch_isbn_metadata_parses_response(monkeypatch):
             return {"name": "Author"}
 
     mock_get = MagicMock(side_effect=[DummyResp(), DummyAuthorResp()])
-    monkeypatch.setattr("services.isbn.requests.get", mock_get)
+    monkeypatch.setattr("services.isbn.http.get", mock_get)
     result = isbn.fetch_isbn_metadata("1234567890")
     assert result == {"title": "Sample", "author": "Author"}
 
 
+def test_search_books_caches_normalized_queries(monkeypatch):
+    from prometheus_client import REGISTRY
+
+    class DummyResp:
+        status_code = 200
+
+        def json(self) -> Any:
+            return {"docs": [{"title": "Dune", "author_name": ["Frank Herbert"]}]}
+
+    def hits():
+        return REGISTRY.get_sample_value("cache_hits_total", {"cache": "search"}) or 0
+
+    mock_get = MagicMock(return_value=DummyResp())
+    monkeypatch.setattr("services.isbn.http.get", mock_get)
+    before = hits()
+    first = isbn.search_books("Dune")
+    second = isbn.search_books("  dune ")
+    assert first == second
+    mock_get.assert_called_once()
+    assert hits() == before + 1
+
+
+def test_search_books_does_not_cache_failures(monkeypatch):
+    mock_get = MagicMock(side_effect=Exception("network down"))
+    monkeypatch.setattr("services.isbn.http.get", mock_get)
+    assert isbn.search_books("offline") == []
+    assert isbn.search_books("offline") == []
+    assert mock_get.call_count == 2
+
+
+def test_sqlite_cache_lru_eviction_and_staleness(tmp_path, monkeypatch):
+    from services.cache import FRESH, STALE, SQLiteCache
+
+    cache = SQLiteCache("test", ttl_seconds=10, stale_seconds=10, max_entries=2,
+                        path=str(tmp_path / "cache.sqlite3"))
+    clock = [1000.0]
+    monkeypatch.setattr("services.cache.time.time", lambda: clock[0])
+    cache.set("a", 1)
+    clock[0] += 1
+    cache.set("b", 2)
+    clock[0] += 1
+    assert cache.get("a") == (1, FRESH)  # touch "a" so "b" is least recently used
+    clock[0] += 1
+    cache.set("c", 3)
+    assert cache.get("b") == (None, None)
+    clock[0] += 15
+    assert cache.get("c") == (3, STALE)
+    clock[0] += 10
+    assert cache.get("c") == (None, None)
+
+
+def test_fetch_isbn_metadata_memoizes_author_lookups(monkeypatch):
+    class EditionResp:
+        status_code = 200
+
+        def json(self) -> Any:
+            return {"title": "Edition", "authors": [{"key": "/authors/OL2A"}]}
+
+    class AuthorResp:
+        status_code = 200
+
+        def json(self) -> Any:
+            return {"name": "Shared Author"}
+
+    mock_get = MagicMock(side_effect=[EditionResp(), AuthorResp(), EditionResp()])
+    monkeypatch.setattr("services.isbn.http.get", mock_get)
+    assert isbn.fetch_isbn_metadata("111")["author"] == "Shared Author"
+    assert isbn.fetch_isbn_metadata("222")["author"] == "Shared Author"
+    assert mock_get.call_count == 3
+
+
+def test_fetch_isbn_metadata_batch_against_local_stub(monkeypatch):
+    import json
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlparse
+
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            requests_seen.append(parsed.path)
+            keys = parse_qs(parsed.query)["bibkeys"][0].split(",")
+            body = {
+                k: {"title": f"Title {k[5:]}", "authors": [{"name": "Stub Author", "url": "/authors/OL1A"}]}
+                for k in keys
+                if k != "ISBN:missing"
+            }
+            payload = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        monkeypatch.setattr(isbn, "OPENLIBRARY_URL", f"http://127.0.0.1:{server.server_port}")
+        result = isbn.fetch_isbn_metadata_batch(["978-1", "9782", "missing", "9782"], chunk_size=2)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert result == {
+        "9781": {"title": "Title 9781", "author": "Stub Author"},
+        "9782": {"title": "Title 9782", "author": "Stub Author"},
+    }
+    assert requests_seen == ["/api/books", "/api/books"]
+
+
+def test_to_isbn13_validates_and_converts():
+    assert isbn.to_isbn13("0-306-40615-2") == "9780306406157"
+    assert isbn.to_isbn13("978-0-306-40615-7") == "9780306406157"
+    assert isbn.to_isbn13("080442957x") == "9780804429573"
+    assert isbn.to_isbn13("0-306-40615-3") is None
+    assert isbn.to_isbn13("9780306406158") is None
+    assert isbn.to_isbn13("") is None
+
+
+def test_schedulers_review_and_reschedule_vectorized():
+    import numpy as np
+
+    from services import scheduling
+
+    # A new card, a legacy Leitner card in box 3 (due 5 days after its last
+    # review) and a box-5 card, each answered when due
+    state = scheduling.states_from_rows([
+        (1, None, None, None, None, None, None, None, None),
+        (3, None, None, None, None, None, None, None, "2026-01-06T00:00:00"),
+        (5, None, None, None, None, None, None, None, "2026-01-21T00:00:00"),
+    ])
+    correct = np.array([True, True, False])
+    now = np.array(["2026-01-01T00:00:00", "2026-01-06T00:00:00", "2026-01-21T00:00:00"], dtype="datetime64[s]")
+
+    leitner = scheduling.SCHEDULERS["leitner"].review(state, correct, now)
+    assert leitner["srs_box"].tolist() == [2, 4, 1]
+    assert leitner["interval_days"].tolist() == [2, 10, 1]
+    assert leitner["lapses"].tolist() == [0, 0, 1]
+
+    sm2 = scheduling.SCHEDULERS["sm2"].review(state, correct, now)
+    # Box 3 counts as two earlier successes: interval 5 days times ease 2.5
+    assert sm2["interval_days"].tolist() == [1, 12, 1]
+    assert sm2["repetitions"].tolist() == [1, 3, 0]
+    assert sm2["ease"][2] < 2.5
+
+    fsrs = scheduling.SCHEDULERS["fsrs"].review(state, correct, now)
+    assert fsrs["stability"][0] == scheduling.FSRS.weights[2]
+    assert fsrs["stability"][1] > 5 and fsrs["stability"][2] < 20
+    assert (fsrs["next_review_at"] > now).all()
+
+    # Rescheduling keeps the last review, leaves new cards alone and is idempotent for Leitner
+    rescheduled = scheduling.SCHEDULERS["leitner"].reschedule(state)
+    assert np.isnat(rescheduled["next_review_at"][0])
+    assert not scheduling.changed(rescheduled, scheduling.SCHEDULERS["leitner"].reschedule(rescheduled)).any()
+    lower = scheduling.FSRS(desired_retention=0.8).reschedule(state)
+    higher = scheduling.FSRS(desired_retention=0.95).reschedule(state)
+    assert (lower["next_review_at"][1:] > higher["next_review_at"][1:]).all()
@@ -0,0 +1,59 @@
+from models import Book, Tombstone, User, UserBook, db, ensure_schema
+
+
+def test_sync_returns_changes_and_deletions_since_token(auth_client, app):
+    dune = auth_client.post("/api/add_to_library", json={"title": "Dune", "author": "Frank Herbert"}).get_json()["book_id"]
+    auth_client.post("/api/add_to_library", json={"title": "Emma", "author": "Jane Austen"})
+    entry_id = auth_client.post("/vocab/api", json={"book_id": dune, "word": "spice"}).get_json()["id"]
+
+    full = auth_client.get("/api/sync").get_json()
+    assert full["full"] is True
+    assert {b["title"] for b in full["books"]} == {"Dune", "Emma"}
+    assert [v["word"] for v in full["vocab"]] == ["spice"]
+    token = full["token"]
+
+    empty = auth_client.get(f"/api/sync?since={token}").get_json()
+    assert (empty["books"], empty["vocab"], empty["token"]) == ([], [], token)
+
+    auth_client.post(f"/books/{dune}/edit", data={"title": "Dune", "author": "Frank Herbert", "rating": "5"})
+    auth_client.delete(f"/vocab/api/{entry_id}")
+    delta = auth_client.get(f"/api/sync?since={token}").get_json()
+    assert [(b["title"], b["rating"]) for b in delta["books"]] == [("Dune", 5)]
+    assert delta["vocab"] == [] and delta["deleted"] == {"books": [], "vocab": [entry_id]}
+
+    auth_client.post(f"/books/{dune}/delete")
+    delta = auth_client.get(f"/api/sync?since={delta['token']}").get_json()
+    assert delta["books"] == [] and delta["deleted"]["books"] == [dune]
+    with app.app_context():
+        assert db.session.query(Tombstone).count() == 2
+
+    assert auth_client.get(f"/api/sync?since={delta['token'] + 1}").status_code == 400
+
+
+def test_ensure_schema_fills_sync_columns_of_existing_links(auth_client, app):
+    with app.app_context():
+        user_id = User.query.filter_by(email="tester@example.com").one().id
+        book = Book(title="Dune", author="Frank Herbert")
+        db.session.add(book)
+        db.session.commit()
+        # A user_book table from before delta sync
+        db.session.execute(db.text("DROP INDEX ix_user_book_user_id_version"))
+        db.session.execute(db.text("ALTER TABLE user_book DROP COLUMN version"))
+        db.session.execute(db.text("ALTER TABLE user_book DROP COLUMN updated_at"))
+        db.session.execute(
+            db.text("INSERT INTO user_book (user_id, book_id, status) VALUES (:user_id, :book_id, 'reading')"),
+            {"user_id": user_id, "book_id": book.id},
+        )
+        db.session.commit()
+
+        ensure_schema()
+        db.create_all()
+        existing = UserBook.query.one()
+        assert existing.updated_at is not None and existing.version == 0
+
+    emma = auth_client.post("/api/add_to_library", json={"title": "Emma", "author": "Jane Austen"}).get_json()["book_id"]
+    with app.app_context():
+        added = UserBook.query.filter_by(book_id=emma).one()
+        assert added.updated_at is not None and added.version >= 1
+    token = auth_client.get("/api/sync").get_json()["token"]
+    assert auth_client.get(f"/api/sync?since={token}").get_json()["books"] == []
@@ -1,3 +1,5 @@
+from datetime import datetime, timedelta
+
 from models import Book, VocabEntry, db
 
 
@@ -105,4 +107,188 @@ def test_submit_answer_progresses_boxes(auth_client, app):
         assert entry.next_review_at is not None
 
 
+def test_due_queue_pages_through_due_cards_only(auth_client, app):
+    book_id = create_book(app)
+    other_book = create_book(app, title="Other")
+    words = ["new-1", "new-2", "due-old", "due-recent", "later"]
+    ids = {w: auth_client.post("/vocab/api", json={"book_id": book_id, "word": w}).get_json()["id"] for w in words}
+    auth_client.post("/vocab/api", json={"book_id": other_book, "word": "elsewhere"})
+    now = datetime.utcnow()
+    with app.app_context():
+        for word, due in (("due-old", now - timedelta(days=3)), ("due-recent", now - timedelta(hours=1)),
+                          ("later", now + timedelta(days=2))):
+            db.session.get(VocabEntry, ids[word]).next_review_at = due
+        db.session.commit()
+
+    seen = []
+    cursor = None
+    while True:
+        url = f"/vocab/review/queue?format=json&mode=due&book_id={book_id}&limit=2"
+        data = auth_client.get(url + (f"&cursor={cursor}" if cursor else "")).get_json()
+        seen += [e["word"] for e in data["entries"]]
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == ["new-1", "new-2", "due-old", "due-recent"]
+
+    all_due = auth_client.get("/vocab/review/queue?format=json&mode=due").get_json()["entries"]
+    assert [e["word"] for e in all_due] == ["new-1", "new-2", "elsewhere", "due-old", "due-recent"]
+    assert auth_client.get("/vocab/review/queue?format=json&mode=due&cursor=bogus").status_code == 400
+
+
+def test_submit_answers_applies_a_session_in_one_request(auth_client, app):
+    book_id = create_book(app)
+    first = auth_client.post("/vocab/api", json={"book_id": book_id, "word": "alpha"}).get_json()["id"]
+    second = auth_client.post("/vocab/api", json={"book_id": book_id, "word": "beta"}).get_json()["id"]
+    token = auth_client.get("/api/sync").get_json()["token"]
+
+    resp = auth_client.post("/vocab/review/answers", json={"answers": [
+        {"entry_id": first, "result": "correct", "answered_at": "2026-01-01T10:05:00Z"},
+        {"entry_id": first, "result": "correct", "answered_at": "2026-01-01T10:00:00Z"},
+        {"entry_id": second, "result": "incorrect", "answered_at": "2026-01-01T10:01:00+00:00"},
+        {"entry_id": 999, "result": "correct"},
+    ]})
+    data = resp.get_json()
+    assert data["not_found"] == [999]
+    assert {u["id"]: (u["srs_box"], u["next_review_at"]) for u in data["updated"]} == {
+        first: (3, "2026-01-06T10:05:00"),
+        second: (1, "2026-01-02T10:01:00"),
+    }
+    with app.app_context():
+        assert db.session.get(VocabEntry, first).srs_box == 3
+    # The bulk UPDATE is visible to delta sync
+    assert {v["id"] for v in auth_client.get(f"/api/sync?since={token}").get_json()["vocab"]} == {first, second}
+
+    bad = auth_client.post("/vocab/review/answers", json={"answers": [{"entry_id": first, "result": "maybe"}]})
+    assert bad.status_code == 400
+
+
+def test_switching_scheduler_reschedules_reviewed_cards(auth_client, app):
+    book_id = create_book(app)
+    reviewed = auth_client.post("/vocab/api", json={"book_id": book_id, "word": "reviewed"}).get_json()["id"]
+    fresh = auth_client.post("/vocab/api", json={"book_id": book_id, "word": "fresh"}).get_json()["id"]
+    assert auth_client.get("/vocab/review/scheduler").get_json()["algorithm"] == "leitner"
+    assert auth_client.post("/vocab/review/scheduler", json={"algorithm": "sm2"}).get_json()["rescheduled"] == 0
+    auth_client.post("/vocab/review/answers", json={"answers": [
+        {"entry_id": reviewed, "result": "correct", "answered_at": "2026-01-01T00:00:00"},
+        {"entry_id": reviewed, "result": "correct", "answered_at": "2026-01-03T00:00:00"},
+    ]})
+    with app.app_context():
+        assert db.session.get(VocabEntry, reviewed).next_review_at == datetime(2026, 1, 9)
+    token = auth_client.get("/api/sync").get_json()["token"]
+
+    resp = auth_client.post("/vocab/review/scheduler", json={"algorithm": "leitner"})
+    assert resp.get_json()["rescheduled"] == 1
+    with app.app_context():
+        entry = db.session.get(VocabEntry, reviewed)
+        # Box 3: 5 days after the last answer instead of SM-2's 6
+        assert entry.interval_days == 5 and entry.next_review_at == datetime(2026, 1, 8)
+        assert db.session.get(VocabEntry, fresh).next_review_at is None
+    delta = auth_client.get(f"/api/sync?since={token}").get_json()
+    assert [v["id"] for v in delta["vocab"]] == [reviewed]
+
+    # SM-2 keeps the current interval, so switching back moves no due date and changes nothing for sync
+    assert auth_client.post("/vocab/review/scheduler", json={"algorithm": "sm2"}).get_json()["rescheduled"] == 0
+    assert auth_client.get(f"/api/sync?since={delta['token']}").get_json()["token"] == delta["token"]
+
+    auth_client.post(f"/vocab/review/{fresh}/answer", data={"result": "correct"})
+    with app.app_context():
+        assert db.session.get(VocabEntry, fresh).repetitions == 1
+    assert auth_client.post("/vocab/review/scheduler", json={"algorithm": "anki"}).status_code == 400
+
+
+def test_review_forecast_bins_due_cards_by_day(auth_client, app):
+    book_id = create_book(app)
+    ids = [auth_client.post("/vocab/api", json={"book_id": book_id, "word": f"w{i}"}).get_json()["id"] for i in range(5)]
+    today = datetime.utcnow().replace(hour=12, minute=0, second=0, microsecond=0)
+    with app.app_context():
+        for entry_id, due in zip(ids, (today - timedelta(days=3), today + timedelta(days=1),
+                                       today + timedelta(days=1), today + timedelta(days=40))):
+            entry = db.session.get(VocabEntry, entry_id)
+            entry.next_review_at, entry.srs_box = due, 5
+        db.session.commit()
+
+    data = auth_client.get("/vocab/review/forecast?days=30").get_json()
+    assert (data["overdue"], data["new"]) == (1, 1)
+    assert len(data["days"]) == 30
+    assert data["days"][1] == {"date": (today + timedelta(days=1)).date().isoformat(), "due": 2}
+    assert sum(d["due"] for d in data["days"]) == 2
+
+    simulated = auth_client.get("/vocab/review/forecast?days=30&mode=simulate&runs=50").get_json()
+    assert simulated["runs"] == 50 and len(simulated["days"]) == 30
+    # Overdue and new cards are answered today; tomorrow brings two cards plus today's misses
+    assert simulated["days"][0]["due"] == 2 and simulated["days"][1]["due"] >= 2
+    # Cached until the deck changes
+    assert auth_client.get("/vocab/review/forecast?days=30&mode=simulate&runs=50").get_json() == simulated
+    auth_client.delete(f"/vocab/api/{ids[4]}")
+    assert auth_client.get("/vocab/review/forecast?days=30&mode=simulate&runs=50").get_json()["days"][0]["due"] == 1
 
+
+def test_answers_are_logged_in_batches_for_retention_analytics(auth_client, app):
+    from models import ReviewLog
+    from services import review_log
+
+    first_book = create_book(app, title="Book A")
+    second_book = create_book(app, title="Book B")
+    alpha = auth_client.post("/vocab/api", json={"book_id": first_book, "word": "alpha"}).get_json()["id"]
+    beta = auth_client.post("/vocab/api", json={"book_id": second_book, "word": "beta"}).get_json()["id"]
+    today = datetime.utcnow().replace(microsecond=0)
+    yesterday = (today - timedelta(days=1)).isoformat()
+    auth_client.post("/vocab/review/answers", json={"answers": [
+        {"entry_id": alpha, "result": "correct", "answered_at": yesterday},
+        {"entry_id": beta, "result": "incorrect", "answered_at": yesterday},
+    ]})
+    auth_client.post(f"/vocab/review/{alpha}/answer", data={"result": "incorrect"})
+    auth_client.post(f"/vocab/review/{beta}/answer", data={"result": "correct"})
+
+    # Buffered, not yet written
+    with app.app_context():
+        assert ReviewLog.query.count() == 0
+
+    boxes = auth_client.get("/vocab/review/retention/box").get_json()["boxes"]
+    assert boxes == [
+        {"srs_box": 1, "reviews": 3, "correct": 2, "retention": 0.6667},
+        {"srs_box": 2, "reviews": 1, "correct": 0, "retention": 0.0},
+    ]
+    books = auth_client.get("/vocab/review/retention/book").get_json()["books"]
+    assert [(b["title"], b["reviews"], b["correct"]) for b in books] == [("Book A", 2, 1), ("Book B", 2, 1)]
+    days = auth_client.get("/vocab/review/retention/day?days=7").get_json()["days"]
+    assert [(d["date"], d["reviews"]) for d in days] == [
+        ((today - timedelta(days=1)).date().isoformat(), 2), (today.date().isoformat(), 2),
+    ]
+    with app.app_context():
+        second_answer = ReviewLog.query.filter_by(vocab_entry_id=alpha, correct=False).one()
+        assert second_answer.srs_box == 2 and second_answer.scheduled_days == 2
+        assert 0.9 < second_answer.elapsed_days < 1.1
+
+    # A full batch is written without waiting for the timer
+    buffer = review_log.ReviewLogBuffer(batch_size=2)
+    row = review_log.log_row(1, alpha, first_book, 1, True, today, None, None, "leitner")
+    buffer.add(app, [row])
+    assert buffer.flush() == 1
+    buffer.add(app, [row, row])
+    assert buffer.flush() == 0
+    with app.app_context():
+        assert ReviewLog.query.count() == 7
+
+
+def test_failed_review_log_write_keeps_rows_buffered(auth_client, app, monkeypatch):
+    from models import ReviewLog
+    from services import review_log
+
+    book_id = create_book(app)
+    entry_id = auth_client.post("/vocab/api", json={"book_id": book_id, "word": "alpha"}).get_json()["id"]
+    row = review_log.log_row(1, entry_id, book_id, 1, True, datetime.utcnow(), None, None, "leitner")
+    buffer = review_log.ReviewLogBuffer(batch_size=10)
+    buffer.add(app, [row, row])
+
+    def broken_insert(table):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(review_log, "insert", broken_insert)
+    assert buffer.flush() == 0
+    monkeypatch.undo()
+    buffer.add(app, [row])
+    assert buffer.flush() == 3
+    with app.app_context():
+        assert ReviewLog.query.count() == 3